@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Benchmark FAISS index types for the RAG example store.
+
+Measures build time, single-query latency (p50/p95), serialized index size and
+recall@k against the exact flat index, for every index type (and optionally
+shortened embeddings), on either real embeddings or synthetic clustered data:
+
+    python scripts/benchmark_index.py --n 200000 --dim 3072 --k 3
+    python scripts/benchmark_index.py --vectors outputs/label_embeddings.npy --dims 256,1024
+
+`--dims` emulates text-embedding-3 shortened embeddings by truncating and
+re-normalizing the vectors, which is how the API's `dimensions` option works.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.services.retrieval_service import INDEX_TYPES, apply_search_params, make_faiss_index
+
+
+def _synthetic(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    labels = rng.integers(0, clusters, size=n)
+    x = centers[labels] + 0.35 * rng.standard_normal((n, dim)).astype("float32")
+    return _normalize(x)
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+def _shorten(x: np.ndarray, dims: int) -> np.ndarray:
+    return _normalize(np.ascontiguousarray(x[:, :dims]))
+
+
+def _latencies(index: faiss.Index, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    found = np.empty((len(queries), k), dtype="int64")
+    lat = np.empty(len(queries))
+    for i, q in enumerate(queries):
+        t = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        lat[i] = time.perf_counter() - t
+        found[i] = ids[0]
+    return lat, found
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def _row(name: str, build_s: float, lat: np.ndarray, size: int, recall: float) -> str:
+    return (
+        f"{name:<24} {build_s:>8.2f} {np.percentile(lat, 50) * 1e3:>9.3f} {np.percentile(lat, 95) * 1e3:>9.3f} "
+        f"{size / 2**20:>10.1f} {recall:>9.3f}"
+    )
+
+
+def run(vectors: np.ndarray, queries: np.ndarray, k: int, types: list[str], dims: list[int],
+        nprobes: list[int], ef_searches: list[int]) -> None:
+    # Ground truth always comes from exact search over the full-size vectors
+    exact = make_faiss_index("flat", vectors)
+    _, truth = exact.search(queries, k)
+
+    print(f"n={len(vectors)} dim={vectors.shape[1]} queries={len(queries)} k={k}\n")
+    print(f"{'index':<24} {'build s':>8} {'p50 ms':>9} {'p95 ms':>9} {'size MiB':>10} {'recall@k':>9}")
+    for d in [vectors.shape[1], *dims]:
+        base = vectors if d == vectors.shape[1] else _shorten(vectors, d)
+        q = queries if d == queries.shape[1] else _shorten(queries, d)
+        suffix = "" if d == vectors.shape[1] else f"@{d}d"
+        for kind in types:
+            t = time.perf_counter()
+            index = make_faiss_index(kind, base)
+            build_s = time.perf_counter() - t
+            size = len(faiss.serialize_index(index))
+            if kind in ("ivf", "ivfpq"):
+                settings_sweep = [(f"{kind}{suffix} nprobe={p}", {"nprobe": p}) for p in nprobes]
+            elif kind == "hnsw":
+                settings_sweep = [(f"{kind}{suffix} ef={e}", {"ef_search": e}) for e in ef_searches]
+            else:
+                settings_sweep = [(f"{kind}{suffix}", {})]
+            for name, params in settings_sweep:
+                apply_search_params(index, **params)
+                lat, found = _latencies(index, q, k)
+                print(_row(name, build_s, lat, size, _recall(found, truth)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FAISS index types: latency, memory and recall@k vs flat.")
+    parser.add_argument("--vectors", type=str, default=None, help="Optional .npy file of embeddings (n x dim)")
+    parser.add_argument("--n", type=int, default=100_000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=3072, help="Synthetic vector size (text-embedding-3-large: 3072)")
+    parser.add_argument("--clusters", type=int, default=512, help="Synthetic cluster count")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--types", type=str, default=",".join(INDEX_TYPES))
+    parser.add_argument("--dims", type=str, default="1024,256", help="Shortened sizes to compare (empty to skip)")
+    parser.add_argument("--nprobe", type=str, default="1,8,32")
+    parser.add_argument("--ef-search", type=str, default="16,64,128")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.vectors:
+        data = _normalize(np.load(args.vectors).astype("float32"))
+        rng = np.random.default_rng(args.seed)
+        pick = rng.choice(len(data), size=min(args.queries, len(data)), replace=False)
+        # Held-out queries, so no query trivially finds itself
+        queries, vectors = data[pick], np.delete(data, pick, axis=0)
+    else:
+        data = _synthetic(args.n + args.queries, args.dim, args.clusters, args.seed)
+        vectors, queries = data[:args.n], data[args.n:]
+
+    run(
+        vectors,
+        queries,
+        k=args.k,
+        types=[t for t in args.types.split(",") if t],
+        dims=[int(d) for d in args.dims.split(",") if d and int(d) < vectors.shape[1]],
+        nprobes=[int(p) for p in args.nprobe.split(",") if p],
+        ef_searches=[int(e) for e in args.ef_search.split(",") if e],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 import os
+import time
 import argparse
+from collections import Counter
 from pathlib import Path
 
 import pandas as pd
@@ -12,10 +14,11 @@ REPO_ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(REPO_ROOT))
 
 from src.services.ocr_service import load_pdf_text
-from src.services.extraction_service import extract_records
+from src.services.extraction_service import extract_records, partition_blocks
 from src.services.retrieval_service import build_index_from_sample
-from src.services.classification_service import classify_record
+from src.services.classification_service import classify_record, extract_and_classify_block
 from src.services.guardrails_service import apply_guardrails
+from src.services.routing_service import classify_routed, routing_models
 from src.core.config import settings
 
 
@@ -23,7 +26,14 @@ DEFAULT_PDF = REPO_ROOT / "data/sample/2._Sample_Inspection_Report.pdf"
 DEFAULT_XLSX = REPO_ROOT / "data/sample/3._Risk_Severity.xlsx"
 
 
-def run_eval(pdf_path: Path, labels_xlsx: Path, use_rag: bool = False, model: str | None = None) -> int:
+def run_eval(
+    pdf_path: Path,
+    labels_xlsx: Path,
+    use_rag: bool = False,
+    model: str | None = None,
+    fused: bool = False,
+    route: bool = False,
+) -> int:
     if not pdf_path.exists():
         raise FileNotFoundError(f"PDF not found: {pdf_path}")
     if not labels_xlsx.exists():
@@ -32,8 +42,15 @@ def run_eval(pdf_path: Path, labels_xlsx: Path, use_rag: bool = False, model: st
     print(f"Loading PDF text from: {pdf_path}")
     full_text = load_pdf_text(str(pdf_path), model_name=model)
 
+    t0 = time.perf_counter()
     print("Extracting records (deficiency, root_cause, corrective, preventive)...")
-    recs = extract_records(full_text, model_name=model, provider=("openai"))
+    if fused:
+        # Blocks the regex misses stay raw and are extracted+classified in one call below
+        recs = partition_blocks(full_text)
+        llm_calls = 0
+    else:
+        recs = extract_records(full_text, model_name=model, provider=("openai"))
+        llm_calls = sum(1 for e in partition_blocks(full_text) if isinstance(e, str))
     if not recs:
         print("No records extracted; cannot evaluate.")
         return 2
@@ -52,20 +69,39 @@ def run_eval(pdf_path: Path, labels_xlsx: Path, use_rag: bool = False, model: st
 
     y_true, y_pred = [], []
     items = []
+    calls_by_model: Counter[str] = Counter()
+    final_by_model: Counter[str] = Counter()
+    escalations: Counter[str] = Counter()
     for i, rec in enumerate(recs, start=1):
         # True label by order (1-based), fallback to None if missing
         true_lbl = id_to_label.get(i, "None")
-        out = classify_record(rec, index, model_name=model, provider=("openai"), use_rag=use_rag)
+        routed = None
+        if route:
+            routed = classify_routed(rec, index, provider=("openai"), use_rag=use_rag)
+            rec, out = routed.record, routed.out
+            calls_by_model.update(routed.models_called)
+            final_by_model[routed.model] += 1
+            escalations.update(r for _, reasons in routed.steps for r in reasons)
+            llm_calls += len(routed.models_called)
+        elif isinstance(rec, str):
+            rec, out = extract_and_classify_block(rec, index, model_name=model, provider=("openai"), use_rag=use_rag)
+            llm_calls += 1
+        else:
+            out = classify_record(rec, index, model_name=model, provider=("openai"), use_rag=use_rag)
+            llm_calls += 1
         final_lbl = apply_guardrails(rec, out.risk).value
 
         y_true.append(true_lbl)
         y_pred.append(final_lbl)
 
-        items.append({
+        item = {
             "Deficiency": i,
             "true": true_lbl,
             "pred": final_lbl,
-        })
+        }
+        if routed is not None:
+            item.update(model=routed.model, escalation=routed.escalation)
+        items.append(item)
 
     print("\nClassification report (macro avg):")
 
@@ -77,6 +113,16 @@ def run_eval(pdf_path: Path, labels_xlsx: Path, use_rag: bool = False, model: st
 
     print(f"Macro Recall: {macro_recall:.3f}")
     print(f"Macro F1:     {macro_f1:.3f}")
+    print(f"LLM calls (extraction + classification): {llm_calls} in {time.perf_counter() - t0:.1f}s"
+          f"{' [fused]' if fused else ''}{' [routed]' if route else ''}")
+    if route:
+        # Ladder order, cheapest first
+        ladder = routing_models()
+        print("Routing (classification calls / final labels per model):")
+        for m in ladder:
+            print(f"  {m:<16} calls={calls_by_model[m]:<5} final={final_by_model[m]}")
+        escalated = sum(1 for it in items if it.get("escalation"))
+        print(f"Escalated records: {escalated}/{len(items)}; reasons: {dict(escalations.most_common())}")
 
     # Save predictions for inspection
     out_dir = REPO_ROOT / "outputs"
@@ -94,10 +140,17 @@ def main():
     parser.add_argument("--labels", type=str, default=str(DEFAULT_XLSX), help="Path to labels Excel")
     parser.add_argument("--rag", action="store_true", help="Enable RAG few-shot examples")
     parser.add_argument("--model", type=str, default=None, help="OpenAI model name for OCR/extraction/classification")
+    parser.add_argument("--fused", action="store_true", help="Extract+classify regex-missed blocks in one LLM call")
+    parser.add_argument(
+        "--route", action="store_true",
+        help="Classify with ROUTING_MODELS cheapest-first, escalating per ROUTING_ESCALATE_ON (prints calls per model)",
+    )
     args = parser.parse_args()
 
     use_rag = bool(args.rag)
-    return_code = run_eval(Path(args.pdf), Path(args.labels), use_rag=use_rag, model=args.model)
+    return_code = run_eval(
+        Path(args.pdf), Path(args.labels), use_rag=use_rag, model=args.model, fused=args.fused, route=args.route,
+    )
     raise SystemExit(return_code)
 
 
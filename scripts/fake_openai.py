@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Local stand-in for the OpenAI chat/embeddings API.
+
+Answers `/v1/chat/completions` and `/v1/embeddings` with plausible, deterministic
+payloads for this app's prompts, after a configurable latency, and enforces
+requests/tokens-per-minute quotas by returning 429 with `retry-after` like the
+real API. Point the app at it with:
+
+    python scripts/fake_openai.py --rpm 60 --tpm 40000 --latency 0.8
+    OPENAI_API_BASE=http://127.0.0.1:8100/v1 OPENAI_API_KEY=sk-fake ./scripts/serve_api.sh
+
+`GET /stats` returns request/429 counters.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from collections import deque
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+class _WindowLimiter:
+    """Sliding 60 s window over requests and (approximate) tokens."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm, self.tpm = rpm, tpm
+        self.events: deque[tuple[float, int]] = deque()
+
+    def check(self, tokens: int) -> float | None:
+        now = time.monotonic()
+        while self.events and now - self.events[0][0] >= 60:
+            self.events.popleft()
+        used_tokens = sum(t for _, t in self.events)
+        over_rpm = self.rpm and len(self.events) >= self.rpm
+        over_tpm = self.tpm and used_tokens + tokens > self.tpm
+        if over_rpm or over_tpm:
+            return max(0.05, 60 - (now - self.events[0][0])) if self.events else 1.0
+        self.events.append((now, tokens))
+        return None
+
+
+def _approx_tokens(body: dict) -> int:
+    return len(json.dumps(body.get("messages") or body.get("input") or "")) // 4 + 1
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+def _prompt_text(body: dict) -> str:
+    parts = []
+    for m in body.get("messages") or []:
+        c = m.get("content")
+        if isinstance(c, str):
+            parts.append(c)
+        elif isinstance(c, list):
+            parts.extend(p.get("text", "") for p in c if p.get("type") == "text")
+    return "\n".join(parts)
+
+
+def _has_image(body: dict) -> bool:
+    return any(
+        isinstance(m.get("content"), list) and any(p.get("type") == "image_url" for p in m["content"])
+        for m in body.get("messages") or []
+    )
+
+
+def _from_schema(schema: dict, rng: random.Random, defs: dict | None = None):
+    """Build a minimal instance of a JSON schema (enough for pydantic validation)."""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return _from_schema(defs.get(schema["$ref"].split("/")[-1], {}), rng, defs)
+    if "anyOf" in schema:
+        return _from_schema(schema["anyOf"][0], rng, defs)
+    if "allOf" in schema:
+        return _from_schema(schema["allOf"][0], rng, defs)
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    kind = schema.get("type")
+    if kind == "object":
+        return {k: _from_schema(v, rng, defs) for k, v in (schema.get("properties") or {}).items()}
+    if kind == "array":
+        return [_from_schema(schema.get("items") or {"type": "string"}, rng, defs)]
+    if kind in ("number", "integer"):
+        return round(rng.uniform(0.5, 1.0), 2) if kind == "number" else 1
+    if kind == "boolean":
+        return False
+    return "fake"
+
+
+_APP_SCHEMA_KEYS = {"risk", "classification", "deficiency"}
+
+
+def _record_field(text: str, label: str) -> str:
+    m = re.search(rf"{label}:\s*(.*)", text)
+    return m.group(1).strip() if m else ""
+
+
+def _reply(body: dict) -> dict:
+    """Return the assistant message for a chat completion request."""
+    text = _prompt_text(body)
+    # Seeded per model too, so routed escalations can change the answer
+    rng = random.Random(_seed(text + str(body.get("model"))))
+    rf = body.get("response_format") or {}
+    tools = body.get("tools") or []
+
+    if rf.get("type") == "json_schema":
+        schema = rf["json_schema"].get("schema", {})
+        # The app's own schemas get the prompt-aware replies below (evidence quoted from the record)
+        if not _APP_SCHEMA_KEYS.intersection(schema.get("properties") or {}):
+            return {"role": "assistant", "content": json.dumps(_from_schema(schema, rng))}
+    if tools:
+        fn = tools[0]["function"]
+        args = _from_schema(fn.get("parameters", {}), rng)
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{rng.getrandbits(32):08x}",
+                "type": "function",
+                "function": {"name": fn["name"], "arguments": json.dumps(args)},
+            }],
+        }
+    if _has_image(body):
+        n = rng.randint(2, 4)
+        lines = [
+            f"Deficiency {i}\nDeficiency: Fire extinguisher in engine room found expired.\n"
+            f"Root Cause: Inspection schedule not followed.\nCorrective Action: Replaced.\n"
+            f"Preventive Action: Added to PMS."
+            for i in range(1, n + 1)
+        ]
+        return {"role": "assistant", "content": "\n\n".join(lines)}
+    if "extraction system" in text:
+        block = text.split("TEXT:", 1)[-1].strip().split("\n\n")[0]
+        return {"role": "assistant", "content": json.dumps({
+            "deficiency": block[:200] or "unspecified deficiency",
+            "root_cause": "", "corrective": "", "preventive": "",
+        })}
+    if "NEW TEXT:" in text:
+        # Fused extract-and-classify prompt
+        block = text.split("NEW TEXT:", 1)[-1].strip()
+        return {"role": "assistant", "content": json.dumps({
+            "record": {"deficiency": block[:200] or "unspecified deficiency",
+                       "root_cause": "", "corrective": "", "preventive": ""},
+            "classification": _classification(rng, block),
+        })}
+    record = text.split("NEW RECORD:", 1)[-1]
+    deficiency = _record_field(record, "DEFICIENCY") or "record"
+    return {"role": "assistant", "content": json.dumps(_classification(rng, deficiency))}
+
+
+def _classification(rng: random.Random, quote: str) -> dict:
+    return {
+        "risk": rng.choice(["High", "Medium", "Low"]),
+        "rationale": "Rule 2: procedural weakness without immediate safety impact.",
+        "evidence": [quote[:60]],
+        "confidence": round(rng.uniform(0.5, 1.0), 2),
+    }
+
+
+def _embedding(text: str, dims: int) -> list[float]:
+    rng = random.Random(_seed(text))
+    vec = [rng.gauss(0, 1) for _ in range(dims)]
+    norm = sum(v * v for v in vec) ** 0.5 or 1.0
+    return [v / norm for v in vec]
+
+
+def create_app(rpm: int = 0, tpm: int = 0, latency: float = 0.5, jitter: float = 0.2, dims: int = 3072) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    limiters: dict[str, _WindowLimiter] = {}
+    stats = {"requests": 0, "rate_limited": 0}
+
+    def _limited(body: dict):
+        stats["requests"] += 1
+        model = body.get("model", "?")
+        lim = limiters.setdefault(model, _WindowLimiter(rpm, tpm))
+        wait = lim.check(_approx_tokens(body))
+        if wait is None:
+            return None
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": f"{wait:.2f}"},
+            content={"error": {
+                "message": f"Rate limit reached for {model}. Please try again in {wait:.2f}s.",
+                "type": "requests", "code": "rate_limit_exceeded", "param": None,
+            }},
+        )
+
+    async def _sleep():
+        await asyncio.sleep(max(0.0, random.gauss(latency, jitter)))
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        limited = _limited(body)
+        if limited is not None:
+            return limited
+        await _sleep()
+        message = _reply(body)
+        prompt_tokens = _approx_tokens(body)
+        completion_tokens = len(json.dumps(message)) // 4 + 1
+        return {
+            "id": f"chatcmpl-fake{stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        limited = _limited(body)
+        if limited is not None:
+            return limited
+        await _sleep()
+        inputs = body.get("input")
+        inputs = [inputs] if isinstance(inputs, (str, int)) or (inputs and isinstance(inputs[0], int)) else inputs
+        size = int(body.get("dimensions") or dims)
+        data = [
+            {"object": "embedding", "index": i, "embedding": _embedding(json.dumps(x), size)}
+            for i, x in enumerate(inputs or [])
+        ]
+        return {
+            "object": "list", "data": data, "model": body.get("model"),
+            "usage": {"prompt_tokens": _approx_tokens(body), "total_tokens": _approx_tokens(body)},
+        }
+
+    @app.get("/stats")
+    def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake OpenAI API with rate limits and latency.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute per model (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="Approx. tokens per minute per model (0 = unlimited)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency standard deviation in seconds")
+    args = parser.parse_args()
+
+    app = create_app(rpm=args.rpm, tpm=args.tpm, latency=args.latency, jitter=args.jitter)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Gunicorn settings for the production API (see scripts/serve_api_prod.sh).
+
+The app is imported once in the parent (`preload_app`), which also loads the
+existing vector indexes so forked workers share them copy-on-write. Workers
+share the cache directory (`APP_CACHE_DIR`) and coordinate writes via file
+locks; each worker keeps its uploads in its own temp directory.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+# Exported before the app is imported so each worker takes its share of the LLM quota
+os.environ["WEB_CONCURRENCY"] = str(workers)
+os.environ["APP_CACHE_DIR"] = os.path.abspath(os.getenv("APP_CACHE_DIR", ".cache"))
+
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+
+def on_starting(server):
+    from src.api.router import warm_indexes
+    warm_indexes()
+
+
+def worker_exit(server, worker):
+    from src.services.cache_service import cleanup_worker_tmp
+    cleanup_worker_tmp(worker.pid)
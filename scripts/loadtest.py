@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""End-to-end HTTP load test for the classification API.
+
+Starts the fake OpenAI API (scripts/fake_openai.py) and the real FastAPI app
+pointed at it (uvicorn for one worker, gunicorn with scripts/gunicorn_conf.py
+for more), then replays synthetic inspection reports of mixed sizes against
+`POST /v1/classify` with Poisson arrivals at a target rate:
+
+    python scripts/loadtest.py --rate 2 --duration 60 --workers 4 --llm-latency 0.8
+    python scripts/loadtest.py --rate 2 --duration 60 --save-baseline outputs/loadtest_baseline.json
+    python scripts/loadtest.py --rate 2 --duration 60 --baseline outputs/loadtest_baseline.json
+
+Reports p50/p95/p99 latency (overall and per report size), throughput, error
+rate, and per worker the peak RSS and event-loop lag read from `GET /v1/metrics`.
+With `--baseline` it compares against a saved run and exits with status 1 when
+a metric regressed by more than `--tolerance`. `--target` load-tests an already
+running server instead (e.g. a staging deployment); its LLM backend is then
+whatever that server is configured with.
+
+Server settings (LLM_*, DEDUP_RECORDS, FUSED_EXTRACTION, ...) are taken from
+the environment, so a baseline is only comparable to runs with the same ones.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import fitz  # PyMuPDF
+import httpx
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+_FINDINGS = [
+    "Fire extinguisher in engine room found expired",
+    "Emergency generator failed to start on auto mode",
+    "Oily water separator 15 ppm alarm not tested",
+    "Lifeboat release gear maintenance records incomplete",
+    "Garbage record book entries not signed by master",
+    "Gangway safety net not rigged",
+    "Fire damper in galley found seized",
+    "Crew unfamiliar with ballast water management plan",
+    "Navigation lights spare bulbs missing",
+    "ECDIS chart corrections not up to date",
+    "Bilge high level alarm inoperative in hold",
+    "Rescue boat engine failed to start",
+]
+_CAUSES = [
+    "Inspection schedule not followed",
+    "Spare parts not ordered in time",
+    "Inadequate familiarization of new crew",
+    "Planned maintenance job not created",
+    "Lack of supervision by responsible officer",
+]
+_ACTIONS = [
+    "Item replaced and tested",
+    "Crew briefed and drill carried out",
+    "Records completed and verified by master",
+    "Repaired by ship staff and confirmed operational",
+]
+_PREVENTIONS = [
+    "Added to planned maintenance system",
+    "Included in monthly safety committee agenda",
+    "Checklist revised and circulated fleet-wide",
+]
+
+
+def _record(rng: random.Random, n: int, malformed: bool) -> str:
+    finding = f"{rng.choice(_FINDINGS)} ({rng.choice(['port', 'starboard', 'aft', 'forward'])} side, item {rng.randint(1, 999)})."
+    if malformed:
+        # No field labels: the regex misses it, so the LLM extractor (or fused mode) handles it
+        return f"Deficiency {n}\nDuring the inspection it was observed that: {finding} {rng.choice(_CAUSES)}."
+    return (
+        f"Deficiency {n}\nDeficiency: {finding}\nRoot Cause: {rng.choice(_CAUSES)}.\n"
+        f"Corrective Action: {rng.choice(_ACTIONS)}.\nPreventive Action: {rng.choice(_PREVENTIONS)}."
+    )
+
+
+def synthetic_pdf(records: int, seed: int, malformed: float) -> bytes:
+    """A text PDF with `records` deficiency blocks (a share of them without field labels)."""
+    rng = random.Random(seed)
+    blocks = [_record(rng, i, rng.random() < malformed) for i in range(1, records + 1)]
+    doc = fitz.open()
+    per_page = 8
+    for start in range(0, len(blocks), per_page):
+        page = doc.new_page()
+        page.insert_textbox(
+            fitz.Rect(40, 40, page.rect.width - 40, page.rect.height - 40),
+            "\n\n".join(blocks[start:start + per_page]),
+            fontsize=8,
+        )
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _parse_mix(spec: str) -> list[tuple[int, float]]:
+    mix = []
+    for part in spec.split(","):
+        records, _, weight = part.partition(":")
+        mix.append((int(records), float(weight or 1)))
+    return mix
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"process exited with {proc.returncode} before {url} became ready")
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.3)
+    raise SystemExit(f"timed out waiting for {url}")
+
+
+@contextmanager
+def local_stack(args):
+    """Run the fake OpenAI API and the app (with a throwaway cache dir); yield the app's base URL."""
+    procs: list[subprocess.Popen] = []
+    try:
+        fake_port, app_port = _free_port(), _free_port()
+        fake = subprocess.Popen([
+            sys.executable, str(REPO_ROOT / "scripts" / "fake_openai.py"),
+            "--port", str(fake_port), "--latency", str(args.llm_latency), "--jitter", str(args.llm_jitter),
+            "--rpm", str(args.llm_rpm), "--tpm", str(args.llm_tpm),
+        ], cwd=REPO_ROOT)
+        procs.append(fake)
+        _wait_ready(f"http://127.0.0.1:{fake_port}/stats", fake)
+
+        cache_dir = tempfile.mkdtemp(prefix="loadtest-cache-")
+        env = {
+            **os.environ,
+            "PYTHONPATH": str(REPO_ROOT),
+            "OPENAI_API_BASE": f"http://127.0.0.1:{fake_port}/v1",
+            "OPENAI_API_KEY": "sk-fake",
+            "OPENAI_API_TYPE": "openai",
+            "APP_CACHE_DIR": cache_dir,
+            "WEB_CONCURRENCY": str(args.workers),
+            "LANGSMITH_TRACING": "false",
+        }
+        if args.workers > 1:
+            env["BIND"] = f"127.0.0.1:{app_port}"
+            cmd = ["gunicorn", "src.app:app", "-c", "scripts/gunicorn_conf.py"]
+        else:
+            cmd = [sys.executable, "-m", "uvicorn", "src.app:app", "--host", "127.0.0.1", "--port", str(app_port)]
+        app = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env)
+        procs.append(app)
+        base = f"http://127.0.0.1:{app_port}"
+        _wait_ready(f"{base}/v1/health", app)
+        yield base
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+        for p in reversed(procs):
+            try:
+                p.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def _latency_summary(values: list[float]) -> dict:
+    return {f"p{q}_ms": _ms(_percentile(values, q)) for q in (50, 95, 99)} | {"max_ms": _ms(max(values, default=None))}
+
+
+def _ms(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1e3, 1)
+
+
+class WorkerMetrics:
+    """Per-pid maxima of `/v1/metrics` samples; each poll opens a new connection to reach any worker."""
+
+    def __init__(self):
+        self.by_pid: dict[int, dict] = {}
+
+    def add(self, sample: dict) -> None:
+        cur = self.by_pid.setdefault(sample["pid"], {"peak_rss_mib": 0.0, "loop_lag_max_ms": 0.0, "loop_lag_p99_ms": 0.0})
+        if sample.get("peak_rss_bytes"):
+            cur["peak_rss_mib"] = max(cur["peak_rss_mib"], round(sample["peak_rss_bytes"] / 2**20, 1))
+        cur["loop_lag_max_ms"] = max(cur["loop_lag_max_ms"], sample["loop_lag_max_ms"])
+        cur["loop_lag_p99_ms"] = max(cur["loop_lag_p99_ms"], sample["loop_lag_p99_ms"])
+
+    async def poll(self, base: str, times: int, reset: bool = False) -> None:
+        params = {"reset": "true"} if reset else None
+        async with httpx.AsyncClient(timeout=10, headers={"Connection": "close"}) as client:
+            for _ in range(times):
+                try:
+                    r = await client.get(f"{base}/v1/metrics", params=params)
+                    r.raise_for_status()
+                    if not reset:
+                        self.add(r.json())
+                except httpx.HTTPError:
+                    pass
+
+
+async def run_load(args, base: str) -> dict:
+    mix = _parse_mix(args.mix)
+    pool = {
+        records: [synthetic_pdf(records, seed=args.seed * 1000 + records * 100 + i, malformed=args.malformed)
+                  for i in range(args.pool)]
+        for records, _ in mix
+    }
+    params = dict(p.split("=", 1) for p in args.param)
+    params.setdefault("use_rag", "false")
+    if args.model:
+        params["model"] = args.model
+
+    results: list[dict] = []
+    metrics = WorkerMetrics()
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=64)
+
+    async with httpx.AsyncClient(base_url=base, timeout=args.timeout, limits=limits) as client:
+
+        async def one(records: int, pdf: bytes) -> None:
+            start = time.perf_counter()
+            status, error = None, None
+            try:
+                r = await client.post(
+                    "/v1/classify",
+                    params=params,
+                    files={"pdf": (f"report-{records}.pdf", pdf, "application/pdf")},
+                )
+                status = r.status_code
+                if r.status_code != 200:
+                    error = f"HTTP {r.status_code}"
+                else:
+                    failed = sum(1 for it in r.json().get("items", []) if it.get("status") != "ok")
+                    if failed:
+                        error = f"{failed} failed records"
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            results.append({
+                "records": records, "status": status, "error": error,
+                "latency": time.perf_counter() - start, "end": time.perf_counter(),
+            })
+
+        print(f"warming up with {args.warmup} request(s)...")
+        for i in range(args.warmup):
+            records = mix[i % len(mix)][0]
+            await one(records, synthetic_pdf(records, seed=-1 - i, malformed=args.malformed))
+        results.clear()
+        await metrics.poll(base, args.workers * 4, reset=True)
+
+        async def sample_metrics(stop: asyncio.Event) -> None:
+            while not stop.is_set():
+                await metrics.poll(base, args.workers * 2)
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=args.metrics_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_metrics(stop))
+        tasks = []
+        sizes = [r for r, _ in mix]
+        weights = [w for _, w in mix]
+        print(f"sending ~{args.rate * args.duration:.0f} requests at {args.rate}/s for {args.duration}s...")
+        t0 = time.perf_counter()
+        next_at = t0
+        while True:
+            next_at += rng.expovariate(args.rate)
+            if next_at - t0 > args.duration:
+                break
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            records = rng.choices(sizes, weights)[0]
+            tasks.append(asyncio.create_task(one(records, rng.choice(pool[records]))))
+        await asyncio.gather(*tasks)
+        elapsed = max((r["end"] for r in results), default=time.perf_counter()) - t0
+        stop.set()
+        await sampler
+        await metrics.poll(base, args.workers * 4)
+
+    ok = [r for r in results if r["error"] is None]
+    summary = {
+        "config": {
+            "rate": args.rate, "duration": args.duration, "mix": args.mix, "workers": args.workers,
+            "llm_latency": args.llm_latency, "params": params, "target": args.target,
+        },
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": round((len(results) - len(ok)) / len(results), 4) if results else 0.0,
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed > 0 else 0.0,
+        "records_per_s": round(sum(r["records"] for r in ok) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": _latency_summary([r["latency"] for r in ok]),
+        "latency_by_size": {
+            str(size): {"requests": sum(1 for r in results if r["records"] == size)}
+            | _latency_summary([r["latency"] for r in ok if r["records"] == size])
+            for size in sizes
+        },
+        "error_kinds": _count(r["error"] for r in results if r["error"]),
+        "workers_seen": {str(pid): m for pid, m in sorted(metrics.by_pid.items())},
+        "peak_rss_mib": max((m["peak_rss_mib"] for m in metrics.by_pid.values()), default=None),
+        "loop_lag_max_ms": max((m["loop_lag_max_ms"] for m in metrics.by_pid.values()), default=None),
+        "loop_lag_p99_ms": max((m["loop_lag_p99_ms"] for m in metrics.by_pid.values()), default=None),
+    }
+    return summary
+
+
+def _count(values) -> dict:
+    out: dict[str, int] = {}
+    for v in values:
+        out[v] = out.get(v, 0) + 1
+    return out
+
+
+def print_summary(s: dict) -> None:
+    lat = s["latency"]
+    print(f"\nrequests={s['requests']} errors={s['errors']} ({s['error_rate']:.2%})")
+    print(f"throughput={s['throughput_rps']} req/s ({s['records_per_s']} records/s)")
+    print(f"latency p50={lat['p50_ms']} p95={lat['p95_ms']} p99={lat['p99_ms']} max={lat['max_ms']} ms")
+    print(f"\n{'records':>8} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for size, row in s["latency_by_size"].items():
+        print(f"{size:>8} {row['requests']:>5} {row['p50_ms']!s:>9} {row['p95_ms']!s:>9} {row['p99_ms']!s:>9}")
+    if s["error_kinds"]:
+        print(f"\nerrors: {s['error_kinds']}")
+    print(f"\n{'worker pid':>10} {'peak RSS MiB':>13} {'lag max ms':>11} {'lag p99 ms':>11}")
+    for pid, m in s["workers_seen"].items():
+        print(f"{pid:>10} {m['peak_rss_mib']:>13} {m['loop_lag_max_ms']:>11} {m['loop_lag_p99_ms']:>11}")
+
+
+# (metric path, higher is worse, absolute change ignored below this)
+_CHECKS = [
+    (("latency", "p50_ms"), True, 50.0),
+    (("latency", "p95_ms"), True, 50.0),
+    (("latency", "p99_ms"), True, 50.0),
+    (("throughput_rps",), False, 0.0),
+    (("peak_rss_mib",), True, 16.0),
+    (("loop_lag_p99_ms",), True, 20.0),
+]
+
+
+def _get(d: dict, path: tuple) -> float | None:
+    for key in path:
+        d = d.get(key) if isinstance(d, dict) else None
+    return d
+
+
+def compare(current: dict, baseline: dict, tolerance: float, error_tolerance: float) -> list[str]:
+    """Return human-readable regressions of `current` against `baseline`."""
+    regressions = []
+    for path, higher_is_worse, floor in _CHECKS:
+        old, new = _get(baseline, path), _get(current, path)
+        if old is None or new is None:
+            continue
+        delta = (new - old) if higher_is_worse else (old - new)
+        if delta > floor and delta > tolerance * abs(old):
+            regressions.append(f"{'.'.join(path)}: {old} -> {new}")
+    if current["error_rate"] - baseline.get("error_rate", 0.0) > error_tolerance:
+        regressions.append(f"error_rate: {baseline.get('error_rate')} -> {current['error_rate']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the classification API end to end.")
+    parser.add_argument("--rate", type=float, default=1.0, help="Mean request arrival rate (requests/s, Poisson)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of arrivals")
+    parser.add_argument("--mix", type=str, default="5:0.5,25:0.35,100:0.15", help="Report sizes as records:weight,...")
+    parser.add_argument("--malformed", type=float, default=0.1, help="Share of blocks without field labels")
+    parser.add_argument("--pool", type=int, default=8, help="Distinct PDFs generated per size")
+    parser.add_argument("--warmup", type=int, default=2, help="Sequential requests before measuring")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Client timeout per request (the UI uses 180 s)")
+    parser.add_argument("--model", type=str, default=None)
+    parser.add_argument("--param", action="append", default=[], help="Extra /classify query parameter key=value")
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes (gunicorn when > 1)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Fake OpenAI mean latency (s)")
+    parser.add_argument("--llm-jitter", type=float, default=0.2)
+    parser.add_argument("--llm-rpm", type=int, default=0, help="Fake OpenAI requests/min per model (0 = unlimited)")
+    parser.add_argument("--llm-tpm", type=int, default=0)
+    parser.add_argument("--target", type=str, default=None, help="Base URL of a running server (skips the local stack)")
+    parser.add_argument("--metrics-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default=None, help="Write the summary JSON here")
+    parser.add_argument("--save-baseline", type=str, default=None, help="Save this run as the baseline")
+    parser.add_argument("--baseline", type=str, default=None, help="Compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    parser.add_argument("--error-tolerance", type=float, default=0.01, help="Allowed absolute error-rate increase")
+    args = parser.parse_args()
+
+    if args.target:
+        summary = asyncio.run(run_load(args, args.target.rstrip("/")))
+    else:
+        with local_stack(args) as base:
+            summary = asyncio.run(run_load(args, base))
+
+    print_summary(summary)
+    for path in filter(None, [args.out, args.save_baseline]):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        print(f"\nsaved {path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline.get("config") != summary["config"]:
+            print("\nwarning: baseline was recorded with a different configuration")
+        regressions = compare(summary, baseline, args.tolerance, args.error_tolerance)
+        if regressions:
+            print("\nREGRESSIONS vs baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nno regressions vs baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Drive the LLM scheduler with several concurrent "reports" against a rate-limited API.
+
+Start the fake API first, e.g. `python scripts/fake_openai.py --rpm 60`, then:
+
+    OPENAI_API_BASE=http://127.0.0.1:8100/v1 OPENAI_API_KEY=sk-fake \
+        python scripts/rate_limit_probe.py --reports 4 --records 30
+
+Prints per-report completion time (fairness), failures, and the scheduler's
+per-model counters (sent/ok/throttled, adaptive concurrency limit). Run with
+LLM_SCHEDULER=false to compare against unscheduled calls.
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.core.schemas import DefRecord
+from src.services.classification_service import classify_record
+from src.services.llm_services import report_scope, scheduler
+
+
+def _run_report(report: int, records: int, model: str | None, workers: int) -> tuple[int, float, int]:
+    start = time.perf_counter()
+    failures = 0
+
+    def _one(i: int) -> bool:
+        rec = DefRecord(deficiency=f"Report {report}: fire extinguisher #{i} found expired in engine room.")
+        with report_scope(f"report-{report}"):
+            try:
+                classify_record(rec, None, model_name=model, provider="openai", use_rag=False)
+                return True
+            except Exception as e:
+                print(f"  report {report} record {i}: {type(e).__name__}: {e}")
+                return False
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        failures = sum(not ok for ok in pool.map(_one, range(records)))
+    return report, time.perf_counter() - start, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise the shared LLM scheduler under a rate limit.")
+    parser.add_argument("--reports", type=int, default=4, help="Concurrent reports")
+    parser.add_argument("--records", type=int, default=30, help="Records per report")
+    parser.add_argument("--workers", type=int, default=8, help="Threads per report")
+    parser.add_argument("--model", type=str, default=None)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.reports) as pool:
+        results = list(pool.map(
+            lambda r: _run_report(r, args.records, args.model, args.workers), range(args.reports),
+        ))
+    total = time.perf_counter() - t0
+
+    for report, secs, failures in results:
+        print(f"report {report}: {secs:7.2f}s  failures={failures}")
+    calls = args.reports * args.records
+    failed = sum(f for _, _, f in results)
+    print(f"\n{calls} calls in {total:.2f}s ({(calls - failed) / total:.2f} ok/s), {failed} failed")
+    for model, snap in scheduler.snapshot().items():
+        print(f"{model}: {snap}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Run the FastAPI server with multiple preloaded worker processes (no --reload).
+# WEB_CONCURRENCY (default: CPU count), BIND (default 0.0.0.0:8000), APP_CACHE_DIR (default ./.cache)
+
+cd "$(dirname "$0")/.."
+
+export PYTHONPATH=.
+
+exec gunicorn src.app:app -c scripts/gunicorn_conf.py
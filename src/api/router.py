@@ -1,23 +1,59 @@
 from __future__ import annotations
 
-import io
+import asyncio
+import contextlib
+import json
+import threading
 import uuid
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import AsyncIterator, Iterable, Iterator
 
-import pandas as pd
-from fastapi import APIRouter, File, UploadFile, HTTPException, Query
+from fastapi import APIRouter, File, Header, Request, UploadFile, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
+from langchain_core.exceptions import OutputParserException
 
 from src.core.config import settings
-from src.api.schemas import HealthResponse, ClassifyResponse, ClassifiedItem
+from src.core.schemas import DefRecord, ClfOut, Risk
+from src.api.schemas import HealthResponse, ClassifyResponse, ClassifiedItem, MetricsResponse
 from src.services.ocr_service import load_pdf_text
-from src.services.extraction_service import extract_records
+from src.services.extraction_service import extract_records, partition_blocks
 from src.services.retrieval_service import build_index_from_sample, load_index, save_index
-from src.services.classification_service import classify_record
+from src.services.classification_service import classify_record, extract_and_classify_block
 from src.services.guardrails_service import apply_guardrails
+from src.services.dedup_service import group_near_duplicates, record_text
+from src.services.llm_services import (
+    Deadline,
+    DeadlineExceeded,
+    StructuredOutputError,
+    chat_model_name,
+    report_scope,
+    scheduler,
+)
+from src.services.routing_service import classify_routed
+from src.services.metrics_service import loop_lag, process_metrics
+from src.services.result_store import ResultWriter, open_result
+from src.services.export_service import EXPORT_FORMATS, iter_export
+from src.services.cache_service import (
+    DirRetention,
+    IngestCache,
+    cache_root,
+    content_key,
+    file_lock,
+    worker_tmp_dir,
+)
 
 
-APP_CACHE = Path(".cache"); APP_CACHE.mkdir(exist_ok=True)
+APP_CACHE = cache_root()
+RESULTS_DIR = APP_CACHE / "results"
+RESULTS_RETENTION = DirRetention(
+    RESULTS_DIR, settings.results_ttl_hours * 3600, settings.results_max_mb * 2**20,
+)
+INGEST_CACHE = IngestCache(
+    APP_CACHE / "ingest",
+    retention=DirRetention(APP_CACHE / "ingest", settings.ingest_ttl_hours * 3600, settings.ingest_max_mb * 2**20),
+)
 
 
 def _index_dir_for_embed_model(embed_model: str) -> Path:
@@ -31,92 +67,469 @@ DEFAULT_SAMPLE_PDF = Path("data/sample/2._Sample_Inspection_Report.pdf")
 
 router = APIRouter()
 
+# Loaded indexes per process, keyed by directory and invalidated when the index is rewritten.
+# Indexes loaded before fork (see warm_indexes) are shared copy-on-write by all workers.
+_INDEXES: dict[str, tuple[float, object]] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def _load_index_cached(index_path: Path, embed_model: str):
+    stamp = index_path.stat().st_mtime
+    with _INDEXES_LOCK:
+        hit = _INDEXES.get(str(index_path))
+        if hit is not None and hit[0] == stamp:
+            return hit[1]
+        index = load_index(str(index_path), embed_model=embed_model)
+        _INDEXES[str(index_path)] = (stamp, index)
+        return index
+
+
+def warm_indexes(embed_models: Iterable[str] = ()) -> None:
+    """Load existing indexes into this process (call in the parent before forking workers)."""
+    for em in (*embed_models, settings.embed_model):
+        index_path = _index_dir_for_embed_model(em)
+        if index_path.exists():
+            _load_index_cached(index_path, em)
+
+
+def _resolve_index(embed_model: str, use_rag: bool | None):
+    """Return (index, effective_use_rag, notice) for the given embedding model."""
+    index_path = _index_dir_for_embed_model(embed_model)
+    notice: str | None = None
+    # Determine effective RAG usage based on query or settings
+    effective_use_rag = settings.use_rag_examples if use_rag is None else use_rag
+    if not index_path.exists() and DEFAULT_LABELS_XLSX.exists() and DEFAULT_SAMPLE_PDF.exists():
+        # Only one worker builds the index; the others wait and then load it
+        with file_lock(index_path.name):
+            if not index_path.exists():
+                vs = build_index_from_sample(str(DEFAULT_SAMPLE_PDF), str(DEFAULT_LABELS_XLSX), embed_model=embed_model)
+                save_index(vs, str(index_path))
+    if index_path.exists():
+        index = _load_index_cached(index_path, embed_model)
+    else:
+        # Graceful fallback: proceed without RAG examples if not explicitly requested
+        if effective_use_rag is True:
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    "RAG examples requested but no vector index found and sample files are missing. "
+                    "Either provide an index (/.cache/index__*) or add data/sample files."
+                ),
+            )
+        index = None
+        effective_use_rag = False
+        notice = (
+            "RAG examples unavailable: no vector index found and no sample data present. "
+            "Proceeding without RAG examples."
+        )
+    return index, effective_use_rag, notice
+
+
+@dataclass
+class _Run:
+    """Per-request pipeline state shared by the JSON, streaming and export paths."""
+
+    report_id: str
+    source: str
+    content_hash: str
+    model: str | None
+    index: object
+    use_rag: bool
+    rag_used: bool
+    notice: str | None
+    dedup: bool
+    fused: bool = False
+    route: bool = False
+    dedup_groups: int | None = None
+    llm_calls_saved: int | None = None
+    deadline: Deadline = field(default_factory=Deadline)
+    not_classified: int = 0
+
+    def meta(self) -> dict:
+        return {
+            "source": self.source,
+            "rag_used": self.rag_used,
+            "notice": self.notice,
+            "dedup_groups": self.dedup_groups,
+            "llm_calls_saved": self.llm_calls_saved,
+        }
+
+
+def _extract(tmp_path: Path, run: _Run) -> list[DefRecord | str]:
+    """Records in report order; in fused mode, blocks the regex misses stay raw text.
+
+    Raises `DeadlineExceeded` if the deadline passes before the text is read (e.g.
+    mid-OCR); past it, LLM extraction stops and the remaining blocks stay unstructured.
+    """
+    with report_scope(run.report_id, run.deadline):
+        try:
+            # Text/OCR output is cached by content so re-uploads skip OCR on any worker
+            text = INGEST_CACHE.get(run.content_hash)
+            if text is None:
+                text = load_pdf_text(str(tmp_path), model_name=run.model)
+                INGEST_CACHE.put(run.content_hash, text)
+        except Exception as e:
+            if run.deadline.expired:
+                raise DeadlineExceeded(f"{run.deadline.reason} before records were extracted") from e
+            raise
+        if run.fused:
+            return partition_blocks(text)
+        return extract_records(text, model_name=run.model, provider=("openai"))
+
+
+def _plan_groups(entries: list[DefRecord | str], run: _Run) -> list[int]:
+    """Map each entry to the index of the entry whose classification it reuses.
+
+    Raw blocks (fused mode) are not extracted yet, so they always stand alone.
+    """
+    rep_of = list(range(len(entries)))
+    if not run.dedup or len(entries) < 2:
+        return rep_of
+    rec_idx = [i for i, e in enumerate(entries) if isinstance(e, DefRecord)]
+    groups = group_near_duplicates(
+        [record_text(entries[i]) for i in rec_idx],
+        threshold=settings.dedup_threshold,
+        # The finding itself must match, not just boilerplate root-cause/action text
+        anchors=[entries[i].deficiency for i in rec_idx],
+    )
+    for group in groups:
+        for j in group:
+            rep_of[rec_idx[j]] = rec_idx[group[0]]
+    run.dedup_groups = len(groups) + len(entries) - len(rec_idx)
+    run.llm_calls_saved = len(rec_idx) - len(groups)
+    return rep_of
+
+
+def _classify_records(entries: list[DefRecord | str], run: _Run) -> Iterator[ClassifiedItem]:
+    """Plan dedup groups now (filling the run's stats) and return a lazy item iterator."""
+    return _iter_classified(entries, _plan_groups(entries, run), run)
+
+
+def _as_record(entry: DefRecord | str) -> DefRecord:
+    return entry if isinstance(entry, DefRecord) else DefRecord(deficiency=entry.strip())
+
+
+def _classify_entry(entry: DefRecord | str, run: _Run) -> tuple[DefRecord, ClfOut | str, dict]:
+    """Classify one record, or extract+classify a raw block in one call (fused mode).
+
+    Returns the record, either its classification or an error message, and the
+    item's `model`/`escalation` fields; raises `DeadlineExceeded` if the run's
+    deadline passed (or it was cancelled) meanwhile.
+    """
+    rec = _as_record(entry)
+    run.deadline.check()
+    try:
+        if run.route:
+            routed = classify_routed(entry, run.index, provider=("openai"), use_rag=run.use_rag)
+            return routed.record, routed.out, {"model": routed.model, "escalation": routed.escalation}
+        if isinstance(entry, DefRecord):
+            out = classify_record(entry, run.index, model_name=run.model, provider=("openai"), use_rag=run.use_rag)
+        else:
+            rec, out = extract_and_classify_block(
+                entry, run.index, model_name=run.model, provider=("openai"), use_rag=run.use_rag,
+            )
+        return rec, out, {"model": chat_model_name(run.model)}
+    except (StructuredOutputError, OutputParserException) as e:
+        # One bad reply fails this record (and its duplicates), not the whole report
+        return rec, str(e), {}
+    except Exception as e:
+        # The SDK wraps the transport's DeadlineExceeded/timeout in its own errors
+        if run.deadline.expired:
+            raise DeadlineExceeded(run.deadline.reason) from e
+        raise
+
+
+def _failed_item(rec: DefRecord, error: str, status: str = "failed", **extra) -> ClassifiedItem:
+    # No LLM label; still surface a guardrail High so safety-critical findings are not lost
+    guard = apply_guardrails(rec, Risk.Low)
+    return ClassifiedItem(
+        deficiency=rec.deficiency,
+        root_cause=rec.root_cause,
+        corrective=rec.corrective,
+        preventive=rec.preventive,
+        risk_llm=None,
+        risk_final=guard if guard == Risk.High else None,
+        rationale="",
+        evidence=[],
+        status=status,
+        error=error,
+        **extra,
+    )
+
+
+def _iter_classified(entries: list[DefRecord | str], rep_of: list[int], run: _Run) -> Iterator[ClassifiedItem]:
+    outputs: dict[int, tuple[ClfOut | str, dict]] = {}
+    for i, entry in enumerate(entries):
+        rep = rep_of[i]
+        group = (rep + 1) if run.dedup_groups is not None else None
+        if rep not in outputs:
+            try:
+                # Scoped per record: a generator resumed from the threadpool does not keep its context
+                with report_scope(run.report_id, run.deadline):
+                    rec, out, routing = _classify_entry(entry, run)
+                outputs[rep] = (out, routing)
+            except DeadlineExceeded as e:
+                # Past the deadline the remaining records are returned unclassified
+                run.not_classified += 1
+                yield _failed_item(_as_record(entry), str(e), status="not_classified", dedup_group=group)
+                continue
+        else:
+            rec = entry
+        out, routing = outputs[rep]
+        if isinstance(out, str):
+            yield _failed_item(rec, out, dedup_group=group)
+            continue
+        # Guardrails always look at this record's own text, even when the label is shared
+        final = apply_guardrails(rec, out.risk)
+        yield ClassifiedItem(
+            deficiency=rec.deficiency,
+            root_cause=rec.root_cause,
+            corrective=rec.corrective,
+            preventive=rec.preventive,
+            risk_llm=out.risk,
+            risk_final=final,
+            rationale=out.rationale,
+            evidence=out.evidence,
+            dedup_group=group,
+            **routing,
+        )
+
+
+def _check_export_format(fmt: str) -> None:
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported format '{fmt}'. Choose one of: {', '.join(EXPORT_FORMATS)}.",
+        )
+
+
+def _export_response(
+    items: Iterable[ClassifiedItem | dict],
+    source: str,
+    fmt: str,
+    full: bool = False,
+    live: bool = False,
+) -> StreamingResponse:
+    """Stream `items` to the client encoded as `fmt`, consuming them lazily.
+
+    With `live` (items still being classified), every row is flushed as soon as it is ready.
+    """
+    _check_export_format(fmt)
+    media_type, ext = EXPORT_FORMATS[fmt]
+    fields = list(ClassifiedItem.model_fields) if full else None
+    dicts = (it if isinstance(it, dict) else it.model_dump(mode="json") for it in items)
+    try:
+        body = iter_export(dicts, fmt, fields, live=live)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = (Path(source or "report").stem or "report") + f"_predictions.{ext}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=\"{filename}\""},
+    )
+
+
+def _recorded(items: Iterable[ClassifiedItem], meta: dict) -> Iterator[ClassifiedItem]:
+    """Pass items through while appending them to a new stored result.
+
+    The result is only committed once the iteration completes; `meta["result_id"]`
+    is set at that point.
+    """
+    with ResultWriter(RESULTS_DIR, meta) as writer:
+        for it in items:
+            writer.write_item(it.model_dump(mode="json"))
+            yield it
+    meta["result_id"] = writer.id
+    RESULTS_RETENTION.maybe_prune()
+
+
+def _ndjson(event: dict) -> bytes:
+    return (json.dumps(event) + "\n").encode("utf-8")
+
+
+def _stream_events(tmp_path: Path, run: _Run) -> Iterator[bytes]:
+    """NDJSON event stream: one `start`, one `item` per record, then `done` (or `error`)."""
+    try:
+        entries = _extract(tmp_path, run)
+        items = _classify_records(entries, run)
+        yield _ndjson({"event": "start", "total": len(entries), **run.meta()})
+        meta = run.meta()
+        count = 0
+        for item in _recorded(items, meta):
+            count += 1
+            yield _ndjson({"event": "item", "index": count, "item": item.model_dump(mode="json")})
+        yield _ndjson({
+            "event": "done",
+            "count": count,
+            "result_id": meta["result_id"],
+            "partial": run.not_classified > 0,
+            "not_classified": run.not_classified,
+        })
+    except Exception as e:
+        yield _ndjson({"event": "error", "detail": str(e)})
+    finally:
+        try:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        except Exception:
+            pass
+
+
+@contextlib.asynccontextmanager
+async def _cancel_on_disconnect(request: Request, deadline: Deadline) -> AsyncIterator[None]:
+    """Cancel `deadline` (and so the request's pending LLM calls) if the client disconnects."""
+
+    async def watch() -> None:
+        while not await request.is_disconnected():
+            await asyncio.sleep(0.5)
+        deadline.cancel("client disconnected")
+
+    task = asyncio.create_task(watch())
+    try:
+        yield
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+def _cancel_when_abandoned(response: StreamingResponse, request: Request, deadline: Deadline) -> StreamingResponse:
+    """Cancel `deadline` if the client disconnects or stops reading `response` before it is complete.
+
+    The connection is watched while the body is produced: Starlette only notices
+    a dropped client when it sends a chunk, and a body may hold chunks back for
+    a long time (e.g. while OCR runs or an encoder fills a batch).
+    """
+    body = response.body_iterator
+
+    async def guarded() -> AsyncIterator[bytes]:
+        finished = False
+        try:
+            async with _cancel_on_disconnect(request, deadline):
+                async for chunk in body:
+                    yield chunk
+            finished = True
+        finally:
+            if not finished:
+                deadline.cancel("client disconnected")
+
+    response.body_iterator = guarded()
+    return response
+
 
 @router.get("/health", response_model=HealthResponse)
 def health_check() -> HealthResponse:
     return HealthResponse(status="ok")
 
 
+@router.get("/metrics", response_model=MetricsResponse)
+def metrics(reset: bool = Query(default=False, description="Reset the event-loop lag maximum after reading")) -> MetricsResponse:
+    """Metrics of the worker process that serves this request (pid, RSS, loop lag, LLM scheduler)."""
+    out = MetricsResponse(**process_metrics(), llm=scheduler.snapshot())
+    if reset:
+        loop_lag.reset()
+    return out
+
+
 @router.post("/classify", response_model=ClassifyResponse)
 async def classify_pdf(
+    request: Request,
     pdf: UploadFile = File(...),
     model: str | None = Query(default=None),
     use_rag: bool | None = Query(default=None, description="Use RAG few-shot examples"),
     embed_model: str | None = Query(default=None, description="Embedding model for vector index"),
     excel: bool | None = Query(default=False, description="Return Excel file (Deficiency/Risk) instead of JSON"),
+    stream: bool | None = Query(default=False, description="Stream NDJSON events, one per classified record"),
+    export_format: str | None = Query(
+        default=None,
+        alias="format",
+        description="Return a file instead of JSON: xlsx, csv, parquet or arrow (streamed as records are classified)",
+    ),
+    full: bool | None = Query(default=False, description="Include every item field in the exported file"),
+    dedup: bool | None = Query(default=None, description="Classify near-duplicate records once per group"),
+    fused: bool | None = Query(
+        default=None, description="Extract and classify blocks the regex extractor misses in one LLM call",
+    ),
+    route: bool | None = Query(
+        default=None, description="Classify with the cheapest model first and escalate per ROUTING_* settings",
+    ),
+    timeout: float | None = Query(
+        default=None, gt=0, description="Deadline in seconds; records not classified by then are returned as such",
+    ),
+    x_request_timeout: float | None = Header(default=None, gt=0, description="Deadline in seconds (same as `timeout`)"),
 ) -> ClassifyResponse | StreamingResponse:
+    # The deadline counts from arrival, so upload and index loading use part of it
+    deadline = Deadline(timeout or x_request_timeout or settings.request_timeout or None)
     if not pdf.filename or not pdf.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Please upload a PDF file.")
+    if excel and not export_format:
+        export_format = "xlsx"
+    if export_format:
+        _check_export_format(export_format)
 
-    tmp_path = APP_CACHE / f"upload_{uuid.uuid4().hex}.pdf"
+    report_id = uuid.uuid4().hex
+    tmp_path = worker_tmp_dir() / f"upload_{report_id}.pdf"
     content = await pdf.read()
     tmp_path.write_bytes(content)
 
     try:
         em = embed_model or settings.embed_model
-        index_path = _index_dir_for_embed_model(em)
-        notice: str | None = None
-        # Determine effective RAG usage based on query or settings
-        effective_use_rag = settings.use_rag_examples if use_rag is None else use_rag
-        if index_path.exists():
-            index = load_index(str(index_path), embed_model=em)
-        else:
-            if DEFAULT_LABELS_XLSX.exists() and DEFAULT_SAMPLE_PDF.exists():
-                vs = build_index_from_sample(str(DEFAULT_SAMPLE_PDF), str(DEFAULT_LABELS_XLSX), embed_model=em)
-                save_index(vs, str(index_path))
-                index = vs
-            else:
-                # Graceful fallback: proceed without RAG examples if not explicitly requested
-                if effective_use_rag is True:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=(
-                            "RAG examples requested but no vector index found and sample files are missing. "
-                            "Either provide an index (/.cache/index__*) or add data/sample files."
-                        ),
-                    )
-                index = None
-                effective_use_rag = False
-                notice = (
-                    "RAG examples unavailable: no vector index found and no sample data present. "
-                    "Proceeding without RAG examples."
-                )
+        index, effective_use_rag, notice = await run_in_threadpool(_resolve_index, em, use_rag)
+    except HTTPException:
+        tmp_path.unlink(missing_ok=True)
+        raise
     except Exception as e:
+        tmp_path.unlink(missing_ok=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+    run = _Run(
+        report_id=report_id,
+        source=pdf.filename,
+        content_hash=content_key(content, model or ""),
+        model=model,
+        index=index,
+        use_rag=effective_use_rag,
+        rag_used=bool(index is not None and effective_use_rag),
+        notice=notice,
+        dedup=settings.dedup_records if dedup is None else dedup,
+        fused=settings.fused_extraction if fused is None else fused,
+        route=settings.model_routing if route is None else route,
+        deadline=deadline,
+    )
+
+    if stream:
+        # The generator owns tmp_path from here on and removes it when done.
+        response = StreamingResponse(_stream_events(tmp_path, run), media_type="application/x-ndjson")
+        return _cancel_when_abandoned(response, request, run.deadline)
+
     try:
-        text = load_pdf_text(str(tmp_path), model_name=model)
-        recs = extract_records(text, model_name=model, provider=("openai"))
-        rows: list[ClassifiedItem] = []
-        for rec in recs:
-            out = classify_record(rec, index, model_name=model, provider=("openai"), use_rag=use_rag)
-            final = apply_guardrails(rec, out.risk)
-            rows.append(ClassifiedItem(
-                deficiency=rec.deficiency,
-                root_cause=rec.root_cause,
-                corrective=rec.corrective,
-                preventive=rec.preventive,
-                risk_llm=out.risk,
-                risk_final=final,
-                rationale=out.rationale,
-                evidence=out.evidence,
-            ))
-        if excel:
-            # Ensure we export plain string labels ("High", "Medium", "Low") not Enum reprs ("Risk.High")
-            risks = [getattr(r.risk_final, "value", str(r.risk_final)) for r in rows]
-            df = pd.DataFrame({
-                "Deficiency": list(range(1, len(risks) + 1)),
-                "Risk": risks,
-            })
-            buf = io.BytesIO(); df.to_excel(buf, index=False); buf.seek(0)
-            filename = (Path(pdf.filename).stem or "report") + "_predictions.xlsx"
-            return StreamingResponse(
-                buf,
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=\"{filename}\""},
-            )
-        rag_used = bool(index is not None and effective_use_rag)
-        return ClassifyResponse(count=len(rows), items=rows, rag_used=rag_used, notice=notice)
+        async with _cancel_on_disconnect(request, run.deadline):
+            # Blocking OCR/LLM work runs in the threadpool so concurrent reports share the scheduler
+            try:
+                entries = await run_in_threadpool(_extract, tmp_path, run)
+            except DeadlineExceeded as e:
+                raise HTTPException(status_code=504, detail=str(e))
+            # Dedup planning (MinHash/LSH) is CPU-bound; keep it off the event loop
+            items = await run_in_threadpool(_classify_records, entries, run)
+            meta = run.meta()
+            items = _recorded(items, meta)
+            if export_format:
+                # Records are classified while the file is being streamed out
+                response = _export_response(items, pdf.filename, export_format, full=bool(full), live=True)
+                return _cancel_when_abandoned(response, request, run.deadline)
+            rows = await run_in_threadpool(list, items)
+        return ClassifyResponse(
+            count=len(rows),
+            items=rows,
+            rag_used=run.rag_used,
+            notice=notice,
+            result_id=meta["result_id"],
+            dedup_groups=run.dedup_groups,
+            llm_calls_saved=run.llm_calls_saved,
+            partial=run.not_classified > 0,
+            not_classified=run.not_classified,
+        )
     finally:
         try:
             if tmp_path.exists():
@@ -125,3 +538,16 @@ async def classify_pdf(
             pass
 
 
+@router.get("/results/{result_id}/export")
+def export_result(
+    result_id: str,
+    export_format: str = Query(default="xlsx", alias="format", description="xlsx, csv, parquet or arrow"),
+    full: bool = Query(default=False, description="Include every item field"),
+) -> StreamingResponse:
+    """Download a previously computed result (e.g. from a streamed classification)."""
+    _check_export_format(export_format)
+    found = open_result(RESULTS_DIR, result_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Unknown result id.")
+    meta, items = found
+    return _export_response(items, meta.get("source") or "report", export_format, full=full)
@@ -9,15 +9,32 @@ class HealthResponse(BaseModel):
     status: str
 
 
+class MetricsResponse(BaseModel):
+    pid: int
+    rss_bytes: int | None = None
+    peak_rss_bytes: int | None = None
+    loop_lag_max_ms: float
+    loop_lag_p99_ms: float
+    llm: dict = {}
+
+
 class ClassifiedItem(BaseModel):
     deficiency: str
     root_cause: str
     corrective: str
     preventive: str
-    risk_llm: Risk
-    risk_final: Risk
+    # None when the record could not be classified (see `status`/`error`)
+    risk_llm: Risk | None
+    risk_final: Risk | None
     rationale: str
     evidence: List[str]
+    dedup_group: int | None = None
+    # Model that produced risk_llm, and (routing mode) why cheaper models' answers were escalated
+    model: str | None = None
+    escalation: str | None = None
+    # "ok", "failed" (bad LLM reply) or "not_classified" (request deadline reached / client gone)
+    status: str = "ok"
+    error: str | None = None
 
 
 class ClassifyResponse(BaseModel):
@@ -25,5 +42,11 @@ class ClassifyResponse(BaseModel):
     items: List[ClassifiedItem]
     rag_used: bool | None = None
     notice: str | None = None
+    result_id: str | None = None
+    dedup_groups: int | None = None
+    llm_calls_saved: int | None = None
+    # True when the deadline cut the run short; see items with status "not_classified"
+    partial: bool = False
+    not_classified: int = 0
 
 
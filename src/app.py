@@ -1,13 +1,23 @@
 from __future__ import annotations
 
 import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from src.api.router import router as api_router
+from src.services.metrics_service import loop_lag
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_lag.start()
+    yield
+    await loop_lag.stop()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="RightShip Risk Classifier API", version="0.2.0")
+    app = FastAPI(title="RightShip Risk Classifier API", version="0.2.0", lifespan=lifespan)
 
     allow_origins = os.getenv("CORS_ALLOW_ORIGINS", "*").split(",")
     app.add_middleware(
@@ -9,7 +9,36 @@ load_dotenv()
 @dataclass
 class Settings:
     embed_model: str = os.getenv("EMBED_MODEL", "text-embedding-3-large")
+    # Vector index built for RAG examples: flat (exact), ivf, hnsw or ivfpq; see README
+    index_type: str = os.getenv("INDEX_TYPE", "flat")
+    # Shortened embedding size for text-embedding-3 models (empty = model default)
+    index_dimensions: int | None = int(os.getenv("INDEX_DIMENSIONS")) if os.getenv("INDEX_DIMENSIONS") else None
+    index_nprobe: int = int(os.getenv("INDEX_NPROBE", "8"))
+    index_ef_search: int = int(os.getenv("INDEX_EF_SEARCH", "64"))
+    # Shared by all worker processes: vector indexes, ingest cache, stored results, locks
+    cache_dir: str = os.getenv("APP_CACHE_DIR", ".cache")
+    # Retention for stored results and cached PDF text (0 disables a limit); pruned after writes
+    results_ttl_hours: float = float(os.getenv("RESULTS_TTL_HOURS", "24"))
+    results_max_mb: int = int(os.getenv("RESULTS_MAX_MB", "1024"))
+    ingest_ttl_hours: float = float(os.getenv("INGEST_TTL_HOURS", "168"))
+    ingest_max_mb: int = int(os.getenv("INGEST_MAX_MB", "2048"))
+    # Number of server worker processes (gunicorn sets this); quotas are split between them
+    workers: int = int(os.getenv("WEB_CONCURRENCY", "1"))
     use_rag_examples: bool = os.getenv("USE_RAG_EXAMPLES", "false").lower() in {"1", "true", "yes", "y"}
+    # Near-duplicate records (same finding, different vessel/date/number) are classified once per group
+    dedup_records: bool = os.getenv("DEDUP_RECORDS", "false").lower() in {"1", "true", "yes", "y"}
+    dedup_threshold: float = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+    # One LLM call returns record + classification for blocks the regex extractor misses
+    fused_extraction: bool = os.getenv("FUSED_EXTRACTION", "false").lower() in {"1", "true", "yes", "y"}
+    # Model routing: classify with the cheapest model first, escalate while a condition holds; see README
+    model_routing: bool = os.getenv("MODEL_ROUTING", "false").lower() in {"1", "true", "yes", "y"}
+    routing_models: str = os.getenv("ROUTING_MODELS", "gpt-5-nano,gpt-5-mini,gpt-5")
+    routing_escalate_on: str = os.getenv(
+        "ROUTING_ESCALATE_ON", "low_confidence,evidence_not_verbatim,guardrail_disagreement,high_label"
+    )
+    routing_min_confidence: float = float(os.getenv("ROUTING_MIN_CONFIDENCE", "0.7"))
+    # Default per-request deadline in seconds (0 = none); clients override it per request
+    request_timeout: float = float(os.getenv("REQUEST_TIMEOUT", "0"))
 
     api_type: str | None = os.getenv("OPENAI_API_TYPE")
     api_key: str | None = os.getenv("OPENAI_API_KEY")
@@ -17,6 +46,20 @@ class Settings:
     api_version: str | None = os.getenv("OPENAI_API_VERSION")
     deployment: str | None = os.getenv("OPENAI_DEPLOYMENT_NAME")
 
+    # "structured": provider JSON-schema response format + targeted repair re-asks;
+    # "parser": legacy PydanticOutputParser with schema text in the prompt
+    llm_output_mode: str = os.getenv("LLM_OUTPUT_MODE", "structured")
+    llm_repair_attempts: int = int(os.getenv("LLM_REPAIR_ATTEMPTS", "2"))
+
+    # Process-wide LLM scheduler (see src/services/llm_services.py)
+    llm_scheduler: bool = os.getenv("LLM_SCHEDULER", "true").lower() in {"1", "true", "yes", "y"}
+    llm_default_rpm: int = int(os.getenv("LLM_DEFAULT_RPM", "500"))
+    llm_default_tpm: int = int(os.getenv("LLM_DEFAULT_TPM", "200000"))
+    # Per-model overrides: "gpt-5=500:450000,gpt-5-mini=1000:2000000" (model=rpm:tpm)
+    llm_rate_limits: str = os.getenv("LLM_RATE_LIMITS", "")
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "6"))
+
 
 settings = Settings()
 
@@ -12,6 +12,7 @@ class ClfOut(BaseModel):
     risk: Risk
     rationale: str = Field(..., description="short reason for the label")
     evidence: list[str] = Field(default_factory=list)
+    confidence: float | None = Field(None, ge=0.0, le=1.0, description="self-reported probability the label is right")
 
 
 class DefRecord(BaseModel):
@@ -21,3 +22,7 @@ class DefRecord(BaseModel):
     preventive: str = Field("")
 
 
+class FusedOut(BaseModel):
+    """Record extracted from a raw block together with its classification (one LLM call)."""
+    record: DefRecord
+    classification: ClfOut
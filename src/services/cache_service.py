@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX dev machines
+    fcntl = None
+
+from src.core.config import settings
+
+
+def cache_root() -> Path:
+    """Shared cache directory (same absolute path for every worker process)."""
+    root = Path(settings.cache_dir).expanduser().resolve()
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+@contextlib.contextmanager
+def file_lock(name: str) -> Iterator[None]:
+    """Exclusive inter-process lock backed by `flock` on `<cache>/locks/<name>.lock`.
+
+    Used around writes that several workers may attempt at once (e.g. building
+    the vector index). Without `fcntl` (non-POSIX) it degrades to a no-op.
+    """
+    lock_dir = cache_root() / "locks"
+    lock_dir.mkdir(exist_ok=True)
+    with open(lock_dir / f"{name}.lock", "a+") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """Write via a temp file in the same directory + rename, so readers never see partial files."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+def worker_tmp_dir() -> Path:
+    """Per-process scratch directory for uploads, removed by `cleanup_worker_tmp`."""
+    path = cache_root() / "tmp" / f"worker-{os.getpid()}"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def cleanup_worker_tmp(pid: int | None = None) -> None:
+    path = cache_root() / "tmp" / f"worker-{pid or os.getpid()}"
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def content_key(data: bytes, *parts: str | None) -> str:
+    h = hashlib.sha256(data)
+    for p in parts:
+        h.update(b"\0" + (p or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+# Suffixes of files a writer has not committed yet (ResultWriter parts, atomic_write_text temps)
+IN_PROGRESS_SUFFIXES = (".part", ".tmp")
+
+
+class DirRetention:
+    """Age/size limits for a cache directory, enforced by `maybe_prune` after writes.
+
+    Files older than `ttl_seconds` are removed, then the oldest files until the
+    directory is under `max_bytes` (0 disables either limit); files written in
+    the last `interval` seconds are never removed for size. Files still being
+    written (`*.part`, `*.tmp`) are left to the TTL alone and do not count
+    towards the size limit. Pruning runs at most once per `interval` seconds
+    per process; concurrent pruning by several workers is harmless
+    (already-deleted files are skipped).
+    """
+
+    def __init__(self, root: Path, ttl_seconds: float, max_bytes: int, interval: float = 60.0):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def maybe_prune(self) -> None:
+        if not (self.ttl_seconds or self.max_bytes):
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._last and now - self._last < self.interval:
+                return
+            self._last = now
+        self.prune()
+
+    def prune(self) -> int:
+        """Apply the limits now; returns the number of files removed."""
+        entries = []
+        for path in self.root.glob("*"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.is_file():
+                entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        now = time.time()
+        cutoff = now - self.ttl_seconds if self.ttl_seconds else None
+        total = sum(size for _, size, path in entries if path.suffix not in IN_PROGRESS_SUFFIXES)
+        removed = 0
+        for mtime, size, path in entries:
+            expired = cutoff is not None and mtime < cutoff
+            if path.suffix in IN_PROGRESS_SUFFIXES:
+                # A writer may still hold it; only a crashed writer's leftovers outlive the TTL
+                if expired:
+                    with contextlib.suppress(FileNotFoundError):
+                        path.unlink()
+                        removed += 1
+                continue
+            over_size = self.max_bytes and total > self.max_bytes and mtime < now - self.interval
+            if not (expired or over_size):
+                break
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+                removed += 1
+            total -= size
+        return removed
+
+
+class IngestCache:
+    """Extracted/OCR'd PDF text keyed by content hash, shared by all workers."""
+
+    def __init__(self, root: Path, retention: DirRetention | None = None):
+        self.root = root
+        self.retention = retention
+
+    def get(self, key: str) -> str | None:
+        path = self.root / f"{key}.txt"
+        try:
+            text = path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        # Hits count as use, so pruning drops the least recently used entries first
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        atomic_write_text(self.root / f"{key}.txt", text)
+        if self.retention is not None:
+            self.retention.maybe_prune()
@@ -4,8 +4,8 @@ from langchain_core.vectorstores import VectorStore
 from langsmith import traceable
 
 from src.core.config import settings
-from src.core.schemas import DefRecord, ClfOut
-from src.services.llm_services import get_chat_llm
+from src.core.schemas import DefRecord, ClfOut, FusedOut
+from src.services.llm_services import get_chat_llm, invoke_structured
 
 
 DEFINITIONS = (
@@ -57,17 +57,40 @@ CLASSIFY_TAIL = (
     "- Read only the NEW RECORD content below.\n"
     "- Apply the DECISION RULES strictly and be conservative for life-safety/pollution.\n"
     "OUTPUT DISCIPLINE:\n"
-    "- Return strict JSON with keys: risk, rationale, evidence.\n"
+    "- Return strict JSON with keys: risk, rationale, evidence, confidence.\n"
     "- rationale: ≤30 words, cite the rule briefly.\n"
     "- evidence: 1–3 verbatim spans from the NEW RECORD (short quotes).\n"
+    "- confidence: your probability (0–1) that the risk label is correct.\n"
     "- No markdown, no extra keys, no explanations.\n\n"
-    "NEW RECORD:\n{record}\n\n"
-    "JSON SCHEMA REMINDER:\n"
-    '{{"risk":"High|Medium|Low","rationale":"short","evidence":["quote1","quote2"]}}'
+    "NEW RECORD:\n{record}"
+)
+
+# Only needed when the schema is not enforced by the provider (parser mode)
+SCHEMA_REMINDER = (
+    "\n\nJSON SCHEMA REMINDER:\n"
+    '{{"risk":"High|Medium|Low","rationale":"short","evidence":["quote1","quote2"],"confidence":0.8}}'
+)
+
+
+FUSED_TAIL = (
+    "INSTRUCTIONS:\n"
+    "- The NEW TEXT below is one raw deficiency block from an inspection report (possibly OCR'd).\n"
+    "- First extract the record: deficiency, root_cause, corrective, preventive (empty string if missing).\n"
+    "- Then classify the extracted record, applying the DECISION RULES strictly and conservatively "
+    "for life-safety/pollution.\n"
+    "OUTPUT DISCIPLINE:\n"
+    "- Return strict JSON with keys: record {{deficiency, root_cause, corrective, preventive}}, "
+    "classification {{risk, rationale, evidence, confidence}}.\n"
+    "- rationale: ≤30 words, cite the rule briefly.\n"
+    "- evidence: 1–3 verbatim spans from the NEW TEXT (short quotes).\n"
+    "- confidence: your probability (0–1) that the risk label is correct.\n"
+    "- No markdown, no extra keys, no explanations.\n\n"
+    "NEW TEXT:\n{record}"
 )
 
 
 _parser = PydanticOutputParser(pydantic_object=ClfOut)
+_fused_parser = PydanticOutputParser(pydantic_object=FusedOut)
 
 
 def _examples_text(docs) -> str:
@@ -90,34 +113,38 @@ def _build_record_text(rec: DefRecord) -> str:
     )
 
 
-def _build_prompt_template(include_examples: bool) -> PromptTemplate:
+def _build_prompt_template(include_examples: bool, structured: bool = False, fused: bool = False) -> PromptTemplate:
+    template = CLASSIFY_HEADER
+    input_vars = ["record"]
     if include_examples:
-        template = (
-            CLASSIFY_HEADER
-            + EXAMPLES_BLOCK
-            + CLASSIFY_TAIL
-            + "\n{format_instructions}"
-        )
-        input_vars = ["record", "examples"]
-    else:
-        template = (
-            CLASSIFY_HEADER
-            + CLASSIFY_TAIL
-            + "\n{format_instructions}"
-        )
-        input_vars = ["record"]
+        template += EXAMPLES_BLOCK
+        input_vars.append("examples")
+    template += FUSED_TAIL if fused else CLASSIFY_TAIL
+    partials = {"definitions": DEFINITIONS, "decision_rules": DECISION_RULES}
+    if not structured:
+        parser = _fused_parser if fused else _parser
+        template += ("" if fused else SCHEMA_REMINDER) + "\n{format_instructions}"
+        partials["format_instructions"] = parser.get_format_instructions()
 
     return PromptTemplate(
         template=template,
         input_variables=input_vars,
-        partial_variables={
-            "definitions": DEFINITIONS,
-            "decision_rules": DECISION_RULES,
-            "format_instructions": _parser.get_format_instructions(),
-        },
+        partial_variables=partials,
     )
 
 
+def _retrieve_examples(query: str, index: VectorStore | None, k: int, use_rag: bool | None) -> str:
+    use_rag_examples = settings.use_rag_examples if use_rag is None else use_rag
+    if not use_rag_examples or index is None:
+        return ""
+    retriever = index.as_retriever(
+        search_type="similarity_score_threshold",
+        search_kwargs={"k": k, "score_threshold": 0.3},
+    )
+    docs = retriever.invoke(query) or []
+    return _examples_text(docs) if docs else ""
+
+
 @traceable
 def classify_record(
     rec: DefRecord,
@@ -127,30 +154,47 @@ def classify_record(
     provider: str | None = None,
     use_rag: bool | None = None,
 ) -> ClfOut:
-    use_rag_examples = settings.use_rag_examples if use_rag is None else use_rag
     record_txt = _build_record_text(rec)
+    examples_block = _retrieve_examples(f"DEFICIENCY: {rec.deficiency}\nROOT_CAUSE: {rec.root_cause}", index, k, use_rag)
+    include_examples = bool(examples_block)
 
-    if use_rag_examples and index is not None:
-        retriever = index.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={"k": k, "score_threshold": 0.3},
-        )
-        q = f"DEFICIENCY: {rec.deficiency}\nROOT_CAUSE: {rec.root_cause}"
-        docs = retriever.invoke(q) or []
-        examples_block = _examples_text(docs) if docs else ""
-        include_examples = bool(examples_block)
-    else:
-        examples_block = ""
-        include_examples = False
-
-    prompt = _build_prompt_template(include_examples)
+    structured = settings.llm_output_mode == "structured"
+    prompt = _build_prompt_template(include_examples, structured=structured)
+    variables = {"record": record_txt, "examples": examples_block} if include_examples else {"record": record_txt}
 
     llm = get_chat_llm(provider, model_name, temperature=0)
+    if structured:
+        return invoke_structured(llm, ClfOut, prompt.invoke(variables).to_messages())
+
     chain = prompt | llm | _parser
+    return chain.invoke(variables)
 
-    if include_examples:
-        return chain.invoke({"record": record_txt, "examples": examples_block})
-    else:
-        return chain.invoke({"record": record_txt})
 
+@traceable
+def extract_and_classify_block(
+    block: str,
+    index: VectorStore,
+    k: int = 3,
+    model_name: str | None = None,
+    provider: str | None = None,
+    use_rag: bool | None = None,
+) -> tuple[DefRecord, ClfOut]:
+    """Extract the record from a raw block and classify it in a single LLM call.
+
+    Used for blocks the regex extractor cannot parse, instead of an extraction
+    call followed by `classify_record`. Guardrails are applied by the caller.
+    """
+    text = block.strip()
+    examples_block = _retrieve_examples(text[:1000], index, k, use_rag)
+    include_examples = bool(examples_block)
 
+    structured = settings.llm_output_mode == "structured"
+    prompt = _build_prompt_template(include_examples, structured=structured, fused=True)
+    variables = {"record": text, "examples": examples_block} if include_examples else {"record": text}
+
+    llm = get_chat_llm(provider, model_name, temperature=0)
+    if structured:
+        out = invoke_structured(llm, FusedOut, prompt.invoke(variables).to_messages())
+    else:
+        out = (prompt | llm | _fused_parser).invoke(variables)
+    return out.record, out.classification
@@ -0,0 +1,127 @@
+import hashlib
+import random
+import re
+
+from src.core.schemas import DefRecord
+
+
+# Tokens that vary between otherwise identical findings in a fleet report
+_VESSEL = re.compile(r"\b(?:M/?V|M/?T|MV|MT|SS)\.?\s+(?:[A-Z0-9][\w-]*\s?){1,3}")
+_DATE = re.compile(
+	r"\b\d{1,4}[./-]\d{1,2}[./-]\d{1,4}\b"
+	r"|\b\d{1,2}\s+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{2,4}\b",
+	flags=re.IGNORECASE,
+)
+_ALNUM_ID = re.compile(r"\b[\w-]*\d[\w-]*\b")
+_NON_WORD = re.compile(r"[^a-z ]+")
+_SPACES = re.compile(r"\s+")
+
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def record_text(rec: DefRecord) -> str:
+	return " ".join([rec.deficiency, rec.root_cause, rec.corrective, rec.preventive])
+
+
+def normalize_text(text: str) -> str:
+	"""Lowercase and mask vessel names, dates and numbers/equipment ids."""
+	text = _VESSEL.sub(" vessel ", text)
+	text = _DATE.sub(" date ", text)
+	text = _ALNUM_ID.sub(" num ", text)
+	text = _NON_WORD.sub(" ", text.lower())
+	return _SPACES.sub(" ", text).strip()
+
+
+def _shingles(text: str, size: int = 3) -> set[str]:
+	words = text.split()
+	if len(words) <= size:
+		return {" ".join(words)}
+	return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+	"""MinHash signatures over word shingles, with LSH banding sized for `threshold`."""
+
+	def __init__(self, threshold: float, num_perm: int = 64, seed: int = 1):
+		rng = random.Random(seed)
+		self.threshold = threshold
+		self.num_perm = num_perm
+		self._perms = [(rng.randrange(1, _MERSENNE), rng.randrange(0, _MERSENNE)) for _ in range(num_perm)]
+		self.bands, self.rows = self._banding(threshold, num_perm)
+
+	@staticmethod
+	def _banding(threshold: float, num_perm: int) -> tuple[int, int]:
+		# Pick the (bands, rows) split whose S-curve midpoint is closest to, but not
+		# above, the threshold, so true matches are rarely missed as candidates.
+		best = (num_perm, 1)
+		best_t = 0.0
+		for rows in range(1, num_perm + 1):
+			if num_perm % rows:
+				continue
+			bands = num_perm // rows
+			t = (1.0 / bands) ** (1.0 / rows)
+			if best_t < t <= threshold:
+				best, best_t = (bands, rows), t
+		return best
+
+	def signature(self, text: str) -> tuple[int, ...]:
+		hashes = [
+			int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+			for s in _shingles(text)
+		]
+		return tuple(
+			min(((a * h + b) % _MERSENNE) & _MAX_HASH for h in hashes)
+			for a, b in self._perms
+		)
+
+	def band_keys(self, sig: tuple[int, ...]) -> list[tuple]:
+		return [(i, sig[i * self.rows:(i + 1) * self.rows]) for i in range(self.bands)]
+
+
+def _similarity(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+	return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def group_near_duplicates(
+	texts: list[str],
+	threshold: float = 0.85,
+	num_perm: int = 64,
+	anchors: list[str] | None = None,
+) -> list[list[int]]:
+	"""Group indices of near-duplicate texts; each group's first index is its representative.
+
+	Texts are normalized, MinHash-signed and bucketed with LSH. A text joins the
+	first earlier group whose representative has estimated Jaccard similarity
+	>= `threshold`; comparing against the representative (not any member)
+	keeps groups from drifting through chains of small edits.
+
+	With `anchors` (e.g. each record's deficiency line) the anchor must reach the
+	threshold too, and candidates are bucketed by anchor. Reports often repeat
+	the same root-cause/corrective/preventive wording under different findings,
+	and that shared text alone must not make them duplicates.
+	"""
+	hasher = MinHasher(threshold, num_perm=num_perm)
+	buckets: dict[tuple, list[int]] = {}
+	groups: list[list[int]] = []
+	rep_sigs: list[tuple[tuple[int, ...], tuple[int, ...]]] = []
+	for i, text in enumerate(texts):
+		sig = hasher.signature(normalize_text(text))
+		anchor_sig = hasher.signature(normalize_text(anchors[i])) if anchors is not None else sig
+		keys = hasher.band_keys(anchor_sig)
+		candidates = sorted({g for key in keys for g in buckets.get(key, ())})
+		match = next(
+			(
+				g for g in candidates
+				if _similarity(anchor_sig, rep_sigs[g][1]) >= threshold and _similarity(sig, rep_sigs[g][0]) >= threshold
+			),
+			None,
+		)
+		if match is None:
+			match = len(groups)
+			groups.append([])
+			rep_sigs.append((sig, anchor_sig))
+			for key in keys:
+				buckets.setdefault(key, []).append(match)
+		groups[match].append(i)
+	return groups
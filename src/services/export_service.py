@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import csv
+import io
+import re
+import time
+import zipfile
+from typing import Iterable, Iterator
+from xml.sax.saxutils import escape
+
+
+# format -> (media type, file extension)
+EXPORT_FORMATS: dict[str, tuple[str, str]] = {
+	"xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+	"csv": ("text/csv; charset=utf-8", "csv"),
+	"parquet": ("application/vnd.apache.parquet", "parquet"),
+	"arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+SUMMARY_COLUMNS = ["Deficiency", "Risk"]
+
+# Rows per flushed chunk for already computed items; live classification flushes every row
+_BATCH_ROWS = 256
+
+
+class _ChunkSink:
+	"""Write-only, non-seekable sink whose buffered bytes are drained by the caller.
+
+	Writers (zipfile, pyarrow) write into it; the export generator yields whatever
+	has accumulated after each row/batch, so nothing beyond one batch is held.
+	"""
+
+	mode = "wb"
+	closed = False
+
+	def __init__(self):
+		self._buf = bytearray()
+		self._pos = 0
+
+	def write(self, data) -> int:
+		self._buf += data
+		self._pos += len(data)
+		return len(data)
+
+	def tell(self) -> int:
+		return self._pos
+
+	def seek(self, *args):
+		raise io.UnsupportedOperation("seek")
+
+	def flush(self) -> None:
+		pass
+
+	def close(self) -> None:
+		pass
+
+	def writable(self) -> bool:
+		return True
+
+	def seekable(self) -> bool:
+		return False
+
+	def drain(self) -> bytes:
+		out = bytes(self._buf)
+		self._buf.clear()
+		return out
+
+
+def export_columns(fields: list[str] | None) -> list[str]:
+	"""Header row: `Deficiency`/`Risk` by default, or `Deficiency` + every item field."""
+	return ["Deficiency", *fields] if fields else list(SUMMARY_COLUMNS)
+
+
+def _cell(value) -> str:
+	if value is None:
+		return ""
+	if isinstance(value, (list, tuple)):
+		return "; ".join(str(v) for v in value)
+	return str(getattr(value, "value", value))
+
+
+def _rows(items: Iterable[dict], fields: list[str] | None) -> Iterator[list]:
+	for i, item in enumerate(items, start=1):
+		if fields:
+			yield [i, *(_cell(item.get(f)) for f in fields)]
+		else:
+			yield [i, _cell(item.get("risk_final"))]
+
+
+def _batches(rows: Iterator[list], size: int) -> Iterator[list[list]]:
+	batch: list[list] = []
+	for row in rows:
+		batch.append(row)
+		if len(batch) >= size:
+			yield batch
+			batch = []
+	if batch:
+		yield batch
+
+
+# ---- XLSX -------------------------------------------------------------------
+
+_XLSX_STATIC_PARTS = [
+	(
+		"[Content_Types].xml",
+		'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+		'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+		'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+		'<Default Extension="xml" ContentType="application/xml"/>'
+		'<Override PartName="/xl/workbook.xml" '
+		'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+		'<Override PartName="/xl/worksheets/sheet1.xml" '
+		'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+		"</Types>",
+	),
+	(
+		"_rels/.rels",
+		'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+		'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+		'<Relationship Id="rId1" '
+		'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+		'Target="xl/workbook.xml"/>'
+		"</Relationships>",
+	),
+	(
+		"xl/workbook.xml",
+		'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+		'<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+		'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+		'<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>'
+		"</workbook>",
+	),
+	(
+		"xl/_rels/workbook.xml.rels",
+		'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+		'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+		'<Relationship Id="rId1" '
+		'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+		'Target="worksheets/sheet1.xml"/>'
+		"</Relationships>",
+	),
+]
+
+_SHEET_HEAD = (
+	b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+	b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = b"</sheetData></worksheet>"
+
+# XML 1.0 forbids most control characters; OCR output occasionally contains them.
+_XML_ILLEGAL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_XLSX_MAX_CELL = 32767
+
+
+def _xlsx_row(values: list) -> bytes:
+	cells = []
+	for v in values:
+		if isinstance(v, (int, float)) and not isinstance(v, bool):
+			cells.append(f"<c><v>{v}</v></c>")
+		else:
+			txt = _XML_ILLEGAL.sub("", str(v))[:_XLSX_MAX_CELL]
+			cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{escape(txt)}</t></is></c>')
+	return ("<row>" + "".join(cells) + "</row>").encode("utf-8")
+
+
+def _iter_xlsx(header: list[str], rows: Iterator[list], batch_rows: int) -> Iterator[bytes]:
+	# Single worksheet with inline strings, written straight into a streamed zip
+	# entry (data descriptors instead of seeking back), so memory stays constant.
+	# The sheet entry is stored uncompressed: a deflate stream holds its output
+	# back until the entry is closed, which would delay the rows until the end.
+	sink = _ChunkSink()
+	with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+		for name, xml in _XLSX_STATIC_PARTS:
+			zf.writestr(name, xml)
+		sheet = zipfile.ZipInfo("xl/worksheets/sheet1.xml", date_time=time.localtime()[:6])
+		sheet.compress_type = zipfile.ZIP_STORED
+		with zf.open(sheet, "w") as ws:
+			ws.write(_SHEET_HEAD)
+			ws.write(_xlsx_row(header))
+			yield sink.drain()
+			for batch in _batches(rows, batch_rows):
+				ws.write(b"".join(_xlsx_row(row) for row in batch))
+				yield sink.drain()
+			ws.write(_SHEET_TAIL)
+	yield sink.drain()
+
+
+# ---- CSV --------------------------------------------------------------------
+
+def _iter_csv(header: list[str], rows: Iterator[list], batch_rows: int) -> Iterator[bytes]:
+	buf = io.StringIO()
+	writer = csv.writer(buf)
+	writer.writerow(header)
+	yield buf.getvalue().encode("utf-8")
+	for batch in _batches(rows, batch_rows):
+		buf.seek(0); buf.truncate()
+		writer.writerows(batch)
+		yield buf.getvalue().encode("utf-8")
+
+
+# ---- Parquet / Arrow --------------------------------------------------------
+
+def _require_pyarrow():
+	try:
+		import pyarrow as pa
+	except ImportError as e:
+		raise ValueError("Parquet/Arrow export requires the 'pyarrow' package (pip install pyarrow).") from e
+	return pa
+
+
+def _iter_arrow_batches(rows: Iterator[list], schema, batch_rows: int):
+	pa = _require_pyarrow()
+	for batch in _batches(rows, batch_rows):
+		columns = zip(*batch)
+		yield pa.RecordBatch.from_arrays([pa.array(col, type=f.type) for col, f in zip(columns, schema)], schema=schema)
+
+
+def _iter_columnar(header: list[str], rows: Iterator[list], fmt: str, batch_rows: int) -> Iterator[bytes]:
+	pa = _require_pyarrow()
+	schema = pa.schema([(header[0], pa.int64()), *((h, pa.string()) for h in header[1:])])
+	sink = _ChunkSink()
+	out = pa.PythonFile(sink, mode="w")
+	if fmt == "parquet":
+		import pyarrow.parquet as pq
+		writer = pq.ParquetWriter(out, schema)
+	else:
+		writer = pa.ipc.new_stream(out, schema)
+	try:
+		for batch in _iter_arrow_batches(rows, schema, batch_rows):
+			writer.write_batch(batch)
+			chunk = sink.drain()
+			if chunk:
+				yield chunk
+	finally:
+		writer.close()
+	yield sink.drain()
+
+
+def iter_export(
+	items: Iterable[dict],
+	fmt: str = "xlsx",
+	fields: list[str] | None = None,
+	live: bool = False,
+) -> Iterator[bytes]:
+	"""Encode classified items (JSON-mode dicts) as `fmt`, yielding bytes as rows are written.
+
+	`items` may be lazy: rows are consumed one at a time and never collected.
+	Output is yielded every `_BATCH_ROWS` rows, or after every row with `live`
+	(items still being classified), so each row reaches the client when ready.
+	With `fields=None` only `Deficiency`/`Risk` (final label) are exported;
+	otherwise one column per listed item field follows the `Deficiency` index.
+	"""
+	if fmt not in EXPORT_FORMATS:
+		raise ValueError(f"Unsupported export format '{fmt}'. Choose one of: {', '.join(EXPORT_FORMATS)}.")
+	if fmt in ("parquet", "arrow"):
+		# Fail before the response starts rather than mid-stream
+		_require_pyarrow()
+	header = export_columns(fields)
+	rows = _rows(items, fields)
+	batch_rows = 1 if live else _BATCH_ROWS
+	if fmt == "xlsx":
+		return _iter_xlsx(header, rows, batch_rows)
+	if fmt == "csv":
+		return _iter_csv(header, rows, batch_rows)
+	return _iter_columnar(header, rows, fmt, batch_rows)
@@ -1,22 +1,31 @@
+import logging
 import re
 from langchain.output_parsers import PydanticOutputParser
 from langchain.prompts import PromptTemplate
+from langchain_core.exceptions import OutputParserException
 
+from src.core.config import settings
 from src.core.schemas import DefRecord
-from src.services.llm_services import get_chat_llm
+from src.services.llm_services import StructuredOutputError, deadline_expired, get_chat_llm, invoke_structured
 
 
+logger = logging.getLogger(__name__)
+
+_EXTRACT_INSTRUCTIONS = (
+	"You are an extraction system for ship inspection reports.\n"
+	"Extract JSON with keys: deficiency, root_cause, corrective, preventive.\n"
+	"If a field is missing, use an empty string.\n"
+	"Return ONLY JSON.\n\nTEXT:\n{block}"
+)
+
 _extract_parser = PydanticOutputParser(pydantic_object=DefRecord)
 _extract_prompt = PromptTemplate(
-	template=(
-		"You are an extraction system for ship inspection reports.\n"
-		"Extract JSON with keys: deficiency, root_cause, corrective, preventive.\n"
-		"If a field is missing, use an empty string.\n"
-		"Return ONLY JSON.\n\nTEXT:\n{block}\n\n{format_instructions}"
-	),
+	template=_EXTRACT_INSTRUCTIONS + "\n\n{format_instructions}",
 	input_variables=["block"],
 	partial_variables={"format_instructions": _extract_parser.get_format_instructions()},
 )
+# Structured mode: the schema is sent as the provider's response format, not as prompt text
+_extract_prompt_structured = PromptTemplate(template=_EXTRACT_INSTRUCTIONS, input_variables=["block"])
 
 _DEF_SPLIT = re.compile(r"\bDeficiency\s+\d+\b", flags=re.IGNORECASE)
 
@@ -51,26 +60,47 @@ def _extract_with_regex(block: str) -> DefRecord | None:
 	return None
 
 
+def _extract_with_llm(block: str, llm) -> DefRecord:
+	try:
+		if settings.llm_output_mode == "structured":
+			messages = _extract_prompt_structured.invoke({"block": block}).to_messages()
+			return invoke_structured(llm, DefRecord, messages)
+		return (_extract_prompt | llm | _extract_parser).invoke({"block": block})
+	except (StructuredOutputError, OutputParserException) as e:
+		# Keep the block visible as an unstructured record rather than dropping it
+		logger.warning("LLM extraction failed, keeping raw block: %s", e)
+		return DefRecord(deficiency=block.strip())
+
+
+def partition_blocks(full_text: str) -> list[DefRecord | str]:
+	"""Regex-extract each deficiency block; blocks the regex misses are returned as raw text."""
+	entries: list[DefRecord | str] = []
+	for b in split_def_blocks(full_text):
+		regex_rec = _extract_with_regex(b)
+		entries.append(regex_rec if regex_rec is not None else b)
+	return entries
+
+
 def extract_records(full_text: str, model_name: str | None = None, provider: str | None = None) -> list[DefRecord]:
-	blocks = split_def_blocks(full_text)
 	recs: list[DefRecord] = []
 	llm = None
-	for b in blocks:
-		# 1) Try regex-first heuristic extraction
-		regex_rec = _extract_with_regex(b)
-		if regex_rec is not None:
-			recs.append(regex_rec)
+	# 1) Regex-first heuristic extraction
+	for entry in partition_blocks(full_text):
+		if isinstance(entry, DefRecord):
+			recs.append(entry)
 			continue
 
-		# 2) Fallback to LLM extraction
+		# 2) Fallback to LLM extraction; past the request deadline, keep the block unstructured
+		if deadline_expired():
+			recs.append(DefRecord(deficiency=entry.strip()))
+			continue
 		try:
 			if llm is None:
 				llm = get_chat_llm(provider, model_name, temperature=0)
-			rec = (_extract_prompt | llm | _extract_parser).invoke({"block": b})
-			recs.append(rec)
-		except Exception:
-			# If LLM extraction also fails, skip this block (no simple fallback).
-			continue
+			recs.append(_extract_with_llm(entry, llm))
+		except Exception as e:
+			# API errors (already retried by the scheduler) must not fail the whole report
+			if not deadline_expired():
+				logger.warning("LLM extraction error, keeping raw block: %s", e)
+			recs.append(DefRecord(deficiency=entry.strip()))
 	return recs
-
-
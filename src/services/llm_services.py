@@ -1,15 +1,623 @@
 from __future__ import annotations
 
+import contextlib
+import contextvars
+import json
 import os
-from typing import Optional
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Iterator, Optional
 
-from langchain_openai import ChatOpenAI
+import httpx
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from pydantic import BaseModel, ValidationError
+
+from src.core.config import settings
+
+
+# ---------------------------------------------------------------------------
+# Process-wide, rate-limit-aware scheduler for OpenAI calls.
+#
+# Every chat/embedding request made through `get_chat_llm` / `get_embeddings`
+# goes through one shared httpx client whose transport asks the scheduler for
+# a slot before sending. Per model the scheduler keeps:
+#   - token buckets for requests/min and tokens/min (estimated before sending),
+#   - an adaptive concurrency limit (halved on 429, grown while latency is ok),
+#   - round-robin queues keyed by report so one large report cannot starve others.
+# 429/5xx responses are retried here with jittered exponential backoff; the
+# OpenAI SDK's own retries are disabled so the two do not compound.
+# A request's `Deadline` (set with `report_scope`) is checked before each
+# attempt and while queued, and caps the HTTP timeout of the call itself.
+# ---------------------------------------------------------------------------
+
+_current_report: contextvars.ContextVar[str] = contextvars.ContextVar("llm_report", default="default")
+_current_deadline: contextvars.ContextVar["Deadline | None"] = contextvars.ContextVar("llm_deadline", default=None)
+
+DEFAULT_COMPLETION_TOKENS = 512
+IMAGE_TOKENS = 800
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# How long the latency baseline stands before it is re-measured, so one fast reply cannot pin it
+LATENCY_BASELINE_WINDOW = 30.0
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed or its client went away; no further LLM calls are made."""
+
+
+class Deadline:
+    """Absolute deadline plus a cancel flag for one request, shared by all threads working on it."""
+
+    def __init__(self, timeout: float | None = None):
+        self.at = time.monotonic() + timeout if timeout else None
+        self.reason: str | None = None
+        self._cancelled = threading.Event()
+
+    def cancel(self, reason: str = "client disconnected") -> None:
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    def remaining(self) -> float | None:
+        return None if self.at is None else self.at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        if self._cancelled.is_set():
+            return True
+        if self.at is not None and time.monotonic() >= self.at:
+            self.reason = self.reason or "deadline exceeded"
+            return True
+        return False
+
+    def check(self) -> None:
+        if self.expired:
+            raise DeadlineExceeded(self.reason)
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep up to `seconds`, waking early on cancellation; raise if the deadline is gone."""
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, max(0.0, remaining))
+        self._cancelled.wait(seconds)
+        self.check()
+
+
+@contextlib.contextmanager
+def report_scope(report_id: str, deadline: Deadline | None = None) -> Iterator[None]:
+    """Attribute LLM calls made inside this block to `report_id` (and its deadline) for fair scheduling."""
+    token = _current_report.set(report_id)
+    dl_token = _current_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(dl_token)
+        _current_report.reset(token)
+
+
+def check_deadline() -> None:
+    """Raise `DeadlineExceeded` if the current request's deadline has passed or it was cancelled."""
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check()
+
+
+def deadline_expired() -> bool:
+    deadline = _current_deadline.get()
+    return deadline is not None and deadline.expired
+
+
+class TokenBucket:
+    """Continuous-refill bucket; `reserve` never blocks, it returns how long to wait."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(max(1, per_minute))
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self._stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def refund(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    __slots__ = ("report", "granted")
+
+    def __init__(self, report: str):
+        self.report = report
+        self.granted = False
+
+
+class _ModelLane:
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(max(1, self.max_concurrency // 2))
+        self.in_flight = 0
+        self.queues: OrderedDict[str, deque[_Ticket]] = OrderedDict()
+        self.paused_until = 0.0
+        self.latency_ewma: float | None = None
+        # Lowest smoothed latency seen within the current window
+        self.latency_baseline: float | None = None
+        self.baseline_at = 0.0
+        self.stats = {"sent": 0, "ok": 0, "rejected": 0, "throttled": 0, "errors": 0, "cancelled": 0}
+
+
+class Lease:
+    """A granted slot for one HTTP attempt; report the outcome with `done`."""
+
+    def __init__(self, scheduler: "LLMScheduler", lane: _ModelLane, tokens: int):
+        self._scheduler = scheduler
+        self._lane = lane
+        self.tokens = tokens
+        self._start = time.monotonic()
+        self._closed = False
+
+    def done(self, status: int | None, retry_after: float | None = None, used_tokens: int | None = None) -> None:
+        if not self._closed:
+            self._closed = True
+            latency = time.monotonic() - self._start
+            self._scheduler._release(self._lane, status, latency, retry_after, self.tokens, used_tokens)
+
+    def cancel(self) -> None:
+        """Return the slot unused (the call was abandoned before it was sent)."""
+        if not self._closed:
+            self._closed = True
+            self._scheduler._abandon(self._lane, self.tokens)
+
+    def abort(self) -> None:
+        """Free the slot of a sent call cut short by its own deadline, without counting it as an error."""
+        if not self._closed:
+            self._closed = True
+            self._scheduler._abandon(self._lane, self.tokens, sent=True)
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        limits: dict[str, tuple[int, int]] | None = None,
+        default_rpm: int = 500,
+        default_tpm: int = 200_000,
+        max_concurrency: int = 16,
+    ):
+        self._limits = dict(limits or {})
+        self._default = (default_rpm, default_tpm)
+        self._max_concurrency = max_concurrency
+        self._lanes: dict[str, _ModelLane] = {}
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_settings(cls) -> "LLMScheduler":
+        # Each worker process has its own scheduler, so give each an equal share of the quota
+        share = max(1, settings.workers)
+        limits = {
+            model: (max(1, rpm // share), max(1, tpm // share))
+            for model, (rpm, tpm) in parse_rate_limits(settings.llm_rate_limits).items()
+        }
+        return cls(
+            limits=limits,
+            default_rpm=max(1, settings.llm_default_rpm // share),
+            default_tpm=max(1, settings.llm_default_tpm // share),
+            max_concurrency=settings.llm_max_concurrency,
+        )
+
+    def _lane(self, model: str) -> _ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            rpm, tpm = self._limits.get(model, self._default)
+            lane = self._lanes[model] = _ModelLane(rpm, tpm, self._max_concurrency)
+        return lane
+
+    def _dispatch(self, lane: _ModelLane) -> None:
+        # Round-robin across reports: serve the head of the oldest queue, then rotate it to the back
+        granted = False
+        while lane.queues and lane.in_flight < int(lane.limit):
+            report, queue = next(iter(lane.queues.items()))
+            queue.popleft().granted = True
+            lane.in_flight += 1
+            granted = True
+            if queue:
+                lane.queues.move_to_end(report)
+            else:
+                del lane.queues[report]
+        if granted:
+            self._cond.notify_all()
+
+    def acquire(self, model: str, tokens: int, deadline: Deadline | None = None) -> Lease:
+        """Block until `model` has a free concurrency slot and quota for `tokens`.
+
+        With a `deadline`, gives up (raising `DeadlineExceeded`) once it expires
+        or is cancelled, whether still queued or waiting for quota.
+        """
+        ticket = _Ticket(_current_report.get())
+        with self._cond:
+            lane = self._lane(model)
+            lane.queues.setdefault(ticket.report, deque()).append(ticket)
+            self._dispatch(lane)
+            while not ticket.granted:
+                if deadline is not None and deadline.expired:
+                    self._withdraw(lane, ticket)
+                    raise DeadlineExceeded(deadline.reason)
+                # Poll so cancellation from another thread is noticed while queued
+                self._cond.wait(None if deadline is None else min(0.25, max(0.01, deadline.remaining() or 0.25)))
+            now = time.monotonic()
+            wait = max(
+                lane.requests.reserve(1, now),
+                lane.tokens.reserve(tokens, now),
+                lane.paused_until - now,
+            )
+            lane.stats["sent"] += 1
+        lease = Lease(self, lane, tokens)
+        if wait > 0:
+            if deadline is None:
+                time.sleep(wait)
+            else:
+                try:
+                    deadline.sleep(wait)
+                except DeadlineExceeded:
+                    lease.cancel()
+                    raise
+            # Our own quota wait is not upstream latency; start the latency clock now
+            lease._start = time.monotonic()
+        return lease
+
+    def _withdraw(self, lane: _ModelLane, ticket: _Ticket) -> None:
+        queue = lane.queues.get(ticket.report)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            lane.stats["cancelled"] += 1
+            if not queue:
+                del lane.queues[ticket.report]
+
+    def _release(
+        self,
+        lane: _ModelLane,
+        status: int | None,
+        latency: float,
+        retry_after: float | None,
+        reserved_tokens: int,
+        used_tokens: int | None,
+    ) -> None:
+        with self._cond:
+            now = time.monotonic()
+            lane.in_flight -= 1
+            if status == 429:
+                # Multiplicative decrease and a shared pause so queued calls do not stampede
+                lane.stats["throttled"] += 1
+                lane.limit = max(1.0, lane.limit / 2)
+                lane.paused_until = max(lane.paused_until, now + (retry_after or 1.0))
+            elif status is None or status >= 500:
+                lane.stats["errors"] += 1
+                lane.limit = max(1.0, lane.limit * 0.9)
+            elif status >= 400:
+                # Rejected without doing the work: says nothing about upstream load
+                lane.stats["rejected"] += 1
+            else:
+                lane.stats["ok"] += 1
+                if used_tokens is not None and used_tokens < reserved_tokens:
+                    lane.tokens.refund(reserved_tokens - used_tokens, now)
+                lane.latency_ewma = latency if lane.latency_ewma is None else 0.8 * lane.latency_ewma + 0.2 * latency
+                if (
+                    lane.latency_baseline is None
+                    or lane.latency_ewma <= lane.latency_baseline
+                    or now - lane.baseline_at > LATENCY_BASELINE_WINDOW
+                ):
+                    lane.latency_baseline = lane.latency_ewma
+                    lane.baseline_at = now
+                if lane.latency_ewma > 3 * lane.latency_baseline:
+                    # Upstream is queueing our calls: back off gently
+                    lane.limit = max(1.0, lane.limit * 0.95)
+                else:
+                    # Additive increase: roughly +1 slot per window of `limit` successes
+                    lane.limit = min(float(lane.max_concurrency), lane.limit + 1.0 / lane.limit)
+            self._dispatch(lane)
+
+    def _abandon(self, lane: _ModelLane, reserved_tokens: int, sent: bool = False) -> None:
+        with self._cond:
+            now = time.monotonic()
+            lane.in_flight -= 1
+            lane.stats["cancelled"] += 1
+            if not sent:
+                # Never reached the provider: give its quota back
+                lane.stats["sent"] -= 1
+                lane.requests.refund(1, now)
+                lane.tokens.refund(reserved_tokens, now)
+            self._dispatch(lane)
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._cond:
+            return {
+                model: {
+                    "limit": round(lane.limit, 2),
+                    "in_flight": lane.in_flight,
+                    "queued": sum(len(q) for q in lane.queues.values()),
+                    "latency_ewma": lane.latency_ewma,
+                    **lane.stats,
+                }
+                for model, lane in self._lanes.items()
+            }
+
+
+def parse_rate_limits(spec: str) -> dict[str, tuple[int, int]]:
+    """Parse "model=rpm:tpm,model2=rpm:tpm" into {model: (rpm, tpm)}."""
+    out: dict[str, tuple[int, int]] = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        model, _, quota = part.partition("=")
+        rpm, _, tpm = quota.partition(":")
+        out[model.strip()] = (int(rpm), int(tpm or settings.llm_default_tpm))
+    return out
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def _count_text_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is not None:
+        try:
+            return len(enc.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    return len(text) // 4 + 1
+
+
+def estimate_tokens(payload: dict) -> int:
+    """Estimate prompt + completion tokens of a chat/embeddings request body."""
+    total = 0
+    for msg in payload.get("messages") or []:
+        total += 4
+        content = msg.get("content")
+        if isinstance(content, str):
+            total += _count_text_tokens(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    total += _count_text_tokens(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    total += IMAGE_TOKENS
+    inp = payload.get("input")
+    if isinstance(inp, str):
+        total += _count_text_tokens(inp)
+    elif isinstance(inp, list):
+        for item in inp:
+            total += len(item) if isinstance(item, list) else _count_text_tokens(str(item))
+    if "messages" in payload:
+        total += int(payload.get("max_completion_tokens") or payload.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+    return max(1, total)
+
+
+def _retry_after(resp: httpx.Response) -> float | None:
+    for header in ("retry-after-ms", "retry-after"):
+        value = resp.headers.get(header)
+        if value:
+            try:
+                secs = float(value)
+            except ValueError:
+                continue
+            return secs / 1000.0 if header.endswith("ms") else secs
+    return None
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None, base: float = 0.5, cap: float = 30.0) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's retry-after."""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    return max(delay, retry_after or 0.0)
+
+
+def _cap_timeout(request: httpx.Request, remaining: float | None) -> None:
+    """Shorten the request's httpx timeouts so the call cannot outlive the deadline."""
+    if remaining is None:
+        return
+    remaining = max(0.01, remaining)
+    current = request.extensions.get("timeout") or {}
+    request.extensions["timeout"] = {
+        key: remaining if current.get(key) is None else min(current[key], remaining)
+        for key in ("connect", "read", "write", "pool")
+    }
+
+
+class ScheduledTransport(httpx.BaseTransport):
+    """httpx transport that routes OpenAI JSON requests through an `LLMScheduler`."""
+
+    def __init__(self, scheduler: LLMScheduler, inner: httpx.BaseTransport | None = None, max_retries: int = 6):
+        self._scheduler = scheduler
+        self._inner = inner or httpx.HTTPTransport(
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        )
+        self._max_retries = max_retries
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            payload = json.loads(request.read() or b"{}")
+            model = payload.get("model")
+        except (ValueError, AttributeError):
+            model = None
+        if not model:
+            return self._inner.handle_request(request)
+
+        tokens = estimate_tokens(payload)
+        deadline = _current_deadline.get()
+        attempt = 0
+        while True:
+            if deadline is not None:
+                deadline.check()
+            lease = self._scheduler.acquire(model, tokens, deadline)
+            try:
+                if deadline is not None:
+                    _cap_timeout(request, deadline.remaining())
+                try:
+                    resp = self._inner.handle_request(request)
+                except httpx.TransportError:
+                    if deadline is not None and deadline.expired:
+                        # Our own timeout cap fired, not a provider fault: no AIMD penalty
+                        lease.abort()
+                        raise
+                    lease.done(None)
+                    if attempt >= self._max_retries:
+                        raise
+                    retry_after = None
+                else:
+                    if resp.status_code not in _RETRYABLE_STATUS:
+                        lease.done(resp.status_code, used_tokens=self._used_tokens(resp))
+                        return resp
+                    retry_after = _retry_after(resp)
+                    lease.done(resp.status_code, retry_after=retry_after)
+                    if attempt >= self._max_retries:
+                        return resp
+                    resp.close()
+            finally:
+                # Any other exception still frees the slot (no-op if already released)
+                lease.done(None)
+            if deadline is None:
+                time.sleep(backoff_delay(attempt, retry_after))
+            else:
+                deadline.sleep(backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    @staticmethod
+    def _used_tokens(resp: httpx.Response) -> int | None:
+        if resp.status_code != 200 or "json" not in resp.headers.get("content-type", ""):
+            return None
+        try:
+            resp.read()
+            return int(resp.json()["usage"]["total_tokens"])
+        except Exception:
+            return None
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+scheduler = LLMScheduler.from_settings()
+
+_client_lock = threading.Lock()
+_client: httpx.Client | None = None
+_client_pid: int | None = None
+
+
+def get_http_client() -> httpx.Client | None:
+    """Shared scheduled HTTP client for this process (None when the scheduler is disabled)."""
+    global _client, _client_pid
+    if not settings.llm_scheduler:
+        return None
+    with _client_lock:
+        # Never reuse pooled connections inherited across fork()
+        if _client is None or _client_pid != os.getpid():
+            _client = httpx.Client(
+                transport=ScheduledTransport(scheduler, max_retries=settings.llm_max_retries),
+                timeout=httpx.Timeout(600.0, connect=10.0),
+            )
+            _client_pid = os.getpid()
+        return _client
+
+
+def chat_model_name(model: Optional[str] = None) -> str:
+    """The chat model used when a caller passes `model` (None means the configured default)."""
+    return model or os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
 
 
 def get_chat_llm(provider: Optional[str] = None, model: Optional[str] = None, temperature: float = 0):
     if provider and provider.lower() != "openai":
         raise ValueError("Only 'openai' provider is supported.")
-    mdl = model or os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
-    return ChatOpenAI(model=mdl, temperature=temperature)
+    mdl = chat_model_name(model)
+    client = get_http_client()
+    if client is None:
+        return ChatOpenAI(model=mdl, temperature=temperature)
+    return ChatOpenAI(model=mdl, temperature=temperature, http_client=client, max_retries=0)
+
+
+def get_embeddings(model: Optional[str] = None, dimensions: Optional[int] = None) -> OpenAIEmbeddings:
+    """OpenAI embeddings; `dimensions` requests shortened vectors (text-embedding-3 models only)."""
+    mdl = model or settings.embed_model
+    extra = {"dimensions": dimensions} if dimensions else {}
+    client = get_http_client()
+    if client is None:
+        return OpenAIEmbeddings(model=mdl, **extra)
+    return OpenAIEmbeddings(model=mdl, http_client=client, max_retries=0, **extra)
+
+
+# ---------------------------------------------------------------------------
+# Structured output with targeted repair
+# ---------------------------------------------------------------------------
+
+REPAIR_SYSTEM = (
+    "You fix JSON replies that failed validation. Return only the corrected JSON object, "
+    "keeping the original content wherever it is valid."
+)
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a structured reply is still invalid after all repair attempts."""
+
+
+def _reply_text(reply: BaseMessage) -> str:
+    content = reply.content
+    if isinstance(content, list):
+        return "".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+    return str(content or "")
+
+
+def _response_format(schema: type[BaseModel]) -> dict:
+    # Not strict: optional fields (e.g. ClfOut.confidence) need not be listed as required
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": schema.__name__, "schema": schema.model_json_schema()},
+    }
+
 
+def invoke_structured(
+    llm: ChatOpenAI,
+    schema: type[BaseModel],
+    messages: list[BaseMessage],
+    repair_attempts: int | None = None,
+) -> BaseModel:
+    """Invoke `llm` with the provider's JSON-schema response format and validate into `schema`.
 
+    The schema travels in the request's `response_format`, not in the prompt. If a
+    reply does not validate, only this call is re-asked: with a short repair
+    prompt containing the bad reply and the validation error (or, when the
+    reply was empty or refused, the original messages again).
+    """
+    bound = llm.bind(response_format=_response_format(schema))
+    attempts = settings.llm_repair_attempts if repair_attempts is None else repair_attempts
+    request = messages
+    error: str = ""
+    for _ in range(attempts + 1):
+        # Transport/API failures (openai.APIError) were already retried by the scheduler
+        reply = bound.invoke(request)
+        bad = _reply_text(reply)
+        if not bad.strip():
+            error = reply.additional_kwargs.get("refusal") or "empty reply"
+            request = messages
+            continue
+        try:
+            return schema.model_validate_json(bad)
+        except ValidationError as e:
+            error = str(e)
+        request = [
+            SystemMessage(content=REPAIR_SYSTEM),
+            HumanMessage(content=f"INVALID REPLY:\n{bad}\n\nVALIDATION ERROR:\n{error[:1000]}"),
+        ]
+    raise StructuredOutputError(f"{schema.__name__} reply invalid after {attempts} repair attempt(s): {error[:300]}")
@@ -10,7 +10,7 @@ import fitz  # PyMuPDF
 from PIL import Image
 from langchain_core.messages import HumanMessage
 
-from src.services.llm_services import get_chat_llm
+from src.services.llm_services import check_deadline, get_chat_llm
 
 
 def _render_pdf_to_images(path: str | Path) -> list[Image.Image]:
@@ -54,6 +54,8 @@ def load_pdf_text(path: str | Path, model_name: str | None = None) -> str:
 	llm = get_chat_llm(model=model_name)
 	page_texts: list[str] = []
 	for img in images:
+		# Stop before the next page once the request's deadline has passed
+		check_deadline()
 		data_url = _image_to_data_url(img)
 		msg = HumanMessage(content=[
 			{"type": "text", "text": (
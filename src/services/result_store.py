@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import json
+import re
+import uuid
+from pathlib import Path
+from typing import Iterator
+
+
+_RESULT_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class ResultWriter:
+	"""Append classified items to a JSONL result file one at a time.
+
+	The first line holds the run metadata, each following line one item. The
+	file only becomes visible to `open_result` once the writer exits cleanly,
+	so aborted runs never leave half-written results behind.
+	"""
+
+	def __init__(self, root: Path, meta: dict):
+		root.mkdir(parents=True, exist_ok=True)
+		self.id = uuid.uuid4().hex
+		self._path = root / f"{self.id}.jsonl"
+		self._part = root / f"{self.id}.jsonl.part"
+		self._fh = open(self._part, "w", encoding="utf-8")
+		self._fh.write(json.dumps(meta) + "\n")
+		self.count = 0
+
+	def write_item(self, item: dict) -> None:
+		self._fh.write(json.dumps(item) + "\n")
+		self.count += 1
+
+	def commit(self) -> str:
+		self._fh.close()
+		self._part.replace(self._path)
+		return self.id
+
+	def discard(self) -> None:
+		self._fh.close()
+		self._part.unlink(missing_ok=True)
+
+	def __enter__(self) -> "ResultWriter":
+		return self
+
+	def __exit__(self, exc_type, exc, tb) -> None:
+		if exc_type is None:
+			self.commit()
+		else:
+			self.discard()
+
+
+def open_result(root: Path, result_id: str) -> tuple[dict, Iterator[dict]] | None:
+	"""Return (meta, lazy item iterator) for a committed result, or None if unknown/invalid id."""
+	if not _RESULT_ID.fullmatch(result_id or ""):
+		return None
+	path = root / f"{result_id}.jsonl"
+	if not path.exists():
+		return None
+	fh = open(path, "r", encoding="utf-8")
+	meta = json.loads(fh.readline() or "{}")
+
+	def _items() -> Iterator[dict]:
+		with fh:
+			for line in fh:
+				if line.strip():
+					yield json.loads(line)
+
+	return meta, _items()
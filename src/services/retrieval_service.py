@@ -1,42 +1,172 @@
+import json
+import math
+import os
+import shutil
+
+import faiss
+import numpy as np
 import pandas as pd
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
 from langchain.schema import Document
 
 from src.core.config import settings
 from src.services.extraction_service import extract_records
 from src.services.ocr_service import load_pdf_text
+from src.services.llm_services import get_embeddings
 
-def build_index_from_sample(sample_pdf: str, labels_xlsx: str, embed_model: str | None = None) -> FAISS:
-    full_text = load_pdf_text(sample_pdf)
-    recs = extract_records(full_text)
+# flat: exact search; ivf: inverted lists (probe `nprobe` of `nlist` cells);
+# hnsw: graph search (`ef_search` candidates); ivfpq: ivf + product-quantized codes.
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+INDEX_META_FILE = "index_meta.json"
 
-    df = pd.read_excel(labels_xlsx)
-    df.columns = [str(c).strip().lower() for c in df.columns]
-    m = dict(zip(df["deficiency"].astype(int), df["risk"].astype(str)))
 
-    docs = []
-    for i, r in enumerate(recs, start=1):
-        txt = (
-            f"DEFICIENCY: {r.deficiency}\n"
-            f"ROOT_CAUSE: {r.root_cause}\n"
-            f"CORRECTIVE: {r.corrective}\n"
-            f"PREVENTIVE: {r.preventive}"
-        )
-        lbl = m.get(i, "Low")
-        docs.append(Document(page_content=txt, metadata={"label": lbl}))
+def _ivf_nlist(n: int) -> int:
+	# ~4*sqrt(n) cells, while keeping >= 39 training points per cell as FAISS recommends
+	return max(1, min(int(4 * math.sqrt(n)), n // 39))
 
-    model = (embed_model or settings.embed_model)
-    emb = OpenAIEmbeddings(model=model)
-    return FAISS.from_documents(docs, emb)
 
+def _pq_params(d: int, n: int) -> tuple[int, int]:
+	"""(sub-quantizers, bits per code): ~16 dims per sub-vector, fewer bits for small corpora."""
+	m = next(m for m in (d // 16, 96, 64, 48, 32, 16, 8, 4, 2, 1) if m >= 1 and d % m == 0)
+	# Each PQ codebook has 2**nbits centroids and needs ~39 training points per centroid
+	nbits = max(1, min(8, int(math.log2(max(2, n // 39)))))
+	return m, nbits
 
-def save_index(vs: FAISS, path: str):
-	vs.save_local(path)
 
+def make_faiss_index(index_type: str, vectors: np.ndarray, hnsw_m: int = 32) -> faiss.Index:
+	"""Create, train and fill a FAISS index of `index_type` over float32 `vectors`."""
+	if index_type not in INDEX_TYPES:
+		raise ValueError(f"Unknown index type '{index_type}'. Choose one of: {', '.join(INDEX_TYPES)}.")
+	n, d = vectors.shape
+	if index_type == "flat":
+		index = faiss.IndexFlatL2(d)
+	elif index_type == "hnsw":
+		index = faiss.IndexHNSWFlat(d, hnsw_m)
+		index.hnsw.efConstruction = 200
+	else:
+		nlist = _ivf_nlist(n)
+		quantizer = faiss.IndexFlatL2(d)
+		if index_type == "ivf":
+			index = faiss.IndexIVFFlat(quantizer, d, nlist)
+		else:
+			m, nbits = _pq_params(d, n)
+			index = faiss.IndexIVFPQ(quantizer, d, nlist, m, nbits)
+		index.train(vectors)
+	index.add(vectors)
+	apply_search_params(index, settings.index_nprobe, settings.index_ef_search)
+	return index
 
-def load_index(path: str, embed_model: str | None = None) -> FAISS:
+
+def apply_search_params(index: faiss.Index, nprobe: int | None = None, ef_search: int | None = None) -> None:
+	if isinstance(index, faiss.IndexHNSW) and ef_search:
+		index.hnsw.efSearch = ef_search
+	elif isinstance(index, faiss.IndexIVF) and nprobe:
+		index.nprobe = min(nprobe, index.nlist)
+
+
+def _index_type_of(index: faiss.Index) -> str:
+	if isinstance(index, faiss.IndexHNSW):
+		return "hnsw"
+	if isinstance(index, faiss.IndexIVFPQ):
+		return "ivfpq"
+	if isinstance(index, faiss.IndexIVF):
+		return "ivf"
+	return "flat"
+
+
+def index_meta(vs: FAISS) -> dict:
+	"""Describe a store's index so it can be reloaded with matching embeddings/search params."""
+	index = vs.index
+	meta = {
+		"index_type": _index_type_of(index),
+		"count": int(index.ntotal),
+		"dim": int(index.d),
+		"embed_model": getattr(vs.embedding_function, "model", None),
+		"embed_dimensions": getattr(vs.embedding_function, "dimensions", None),
+	}
+	if isinstance(index, faiss.IndexIVF):
+		meta.update(nlist=int(index.nlist), nprobe=int(index.nprobe))
+	if isinstance(index, faiss.IndexIVFPQ):
+		meta.update(pq_m=int(index.pq.M), pq_nbits=int(index.pq.nbits))
+	if isinstance(index, faiss.IndexHNSW):
+		meta.update(ef_search=int(index.hnsw.efSearch))
+	return meta
+
+
+def build_index_from_sample(
+	sample_pdf: str,
+	labels_xlsx: str,
+	embed_model: str | None = None,
+	index_type: str | None = None,
+	dimensions: int | None = None,
+) -> FAISS:
+	full_text = load_pdf_text(sample_pdf)
+	recs = extract_records(full_text)
+
+	df = pd.read_excel(labels_xlsx)
+	df.columns = [str(c).strip().lower() for c in df.columns]
+	m = dict(zip(df["deficiency"].astype(int), df["risk"].astype(str)))
+
+	docs = []
+	for i, r in enumerate(recs, start=1):
+		txt = (
+			f"DEFICIENCY: {r.deficiency}\n"
+			f"ROOT_CAUSE: {r.root_cause}\n"
+			f"CORRECTIVE: {r.corrective}\n"
+			f"PREVENTIVE: {r.preventive}"
+		)
+		lbl = m.get(i, "Low")
+		docs.append(Document(page_content=txt, metadata={"label": lbl}))
+
+	return build_index(docs, embed_model=embed_model, index_type=index_type, dimensions=dimensions)
+
+
+def build_index(
+	docs: list[Document],
+	embed_model: str | None = None,
+	index_type: str | None = None,
+	dimensions: int | None = None,
+) -> FAISS:
+	"""Embed `docs` and store them in a FAISS index of the requested type."""
 	model = (embed_model or settings.embed_model)
-	return FAISS.load_local(path, OpenAIEmbeddings(model=model), allow_dangerous_deserialization=True)
+	emb = get_embeddings(model, dimensions=dimensions or settings.index_dimensions)
+	kind = index_type or settings.index_type
+	if kind == "flat":
+		return FAISS.from_documents(docs, emb)
 
+	vectors = np.asarray(emb.embed_documents([d.page_content for d in docs]), dtype="float32")
+	index = make_faiss_index(kind, vectors)
+	ids = [str(i) for i in range(len(docs))]
+	return FAISS(
+		embedding_function=emb,
+		index=index,
+		docstore=InMemoryDocstore(dict(zip(ids, docs))),
+		index_to_docstore_id=dict(enumerate(ids)),
+	)
 
+
+def save_index(vs: FAISS, path: str):
+	# Write next to the target and rename so concurrent readers never load a partial index
+	tmp = f"{path}.tmp-{os.getpid()}"
+	shutil.rmtree(tmp, ignore_errors=True)
+	vs.save_local(tmp)
+	with open(os.path.join(tmp, INDEX_META_FILE), "w", encoding="utf-8") as fh:
+		json.dump(index_meta(vs), fh, indent=2)
+	if os.path.isdir(path):
+		shutil.rmtree(path)
+	os.replace(tmp, path)
+
+
+def load_index(path: str, embed_model: str | None = None) -> FAISS:
+	meta_path = os.path.join(path, INDEX_META_FILE)
+	meta = {}
+	if os.path.exists(meta_path):
+		with open(meta_path, encoding="utf-8") as fh:
+			meta = json.load(fh)
+	# Queries must be embedded exactly like the stored vectors
+	model = meta.get("embed_model") or embed_model or settings.embed_model
+	emb = get_embeddings(model, dimensions=meta.get("embed_dimensions"))
+	vs = FAISS.load_local(path, emb, allow_dangerous_deserialization=True)
+	apply_search_params(vs.index, settings.index_nprobe, settings.index_ef_search)
+	return vs
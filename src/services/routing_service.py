@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Callable
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.vectorstores import VectorStore
+
+from src.core.config import settings
+from src.core.schemas import ClfOut, DefRecord, Risk
+from src.services.classification_service import classify_record, extract_and_classify_block
+from src.services.dedup_service import record_text
+from src.services.guardrails_service import apply_guardrails
+from src.services.llm_services import StructuredOutputError
+
+
+ESCALATION_CONDITIONS = ("low_confidence", "evidence_not_verbatim", "guardrail_disagreement", "high_label")
+
+_FIELD_LABEL = re.compile(r"^\s*(?:deficiency|root[ _]?cause|corrective|preventive)\s*:\s*", flags=re.IGNORECASE)
+_ELLIPSIS = re.compile(r"\.\.\.|…")
+_QUOTES = str.maketrans({c: None for c in "\"'`“”‘’"})
+_SPACES = re.compile(r"\s+")
+
+
+@dataclass
+class RoutedOut:
+    record: DefRecord
+    out: ClfOut
+    model: str
+    # (model, reasons) for every model whose answer was escalated, cheapest first
+    steps: list[tuple[str, list[str]]] = field(default_factory=list)
+
+    @property
+    def escalation(self) -> str | None:
+        """E.g. "gpt-5-nano: high_label; gpt-5-mini: low_confidence", or None if the first model's answer stood."""
+        return "; ".join(f"{m}: {','.join(reasons)}" for m, reasons in self.steps) or None
+
+    @property
+    def models_called(self) -> list[str]:
+        return [m for m, _ in self.steps] + [self.model]
+
+
+def routing_models(spec: str | None = None) -> list[str]:
+    models = [m.strip() for m in (spec or settings.routing_models).split(",") if m.strip()]
+    if not models:
+        raise ValueError("ROUTING_MODELS must name at least one model.")
+    return models
+
+
+def escalation_conditions(spec: str | None = None) -> set[str]:
+    conditions = {c.strip() for c in (spec if spec is not None else settings.routing_escalate_on).split(",") if c.strip()}
+    unknown = conditions - set(ESCALATION_CONDITIONS)
+    if unknown:
+        raise ValueError(f"Unknown escalation condition(s): {', '.join(sorted(unknown))}.")
+    return conditions
+
+
+def _normalize(text: str) -> str:
+    return _SPACES.sub(" ", text.translate(_QUOTES).lower()).strip()
+
+
+def evidence_is_verbatim(evidence: list[str], source: str) -> bool:
+    """True if every evidence span occurs in `source`, ignoring case, spacing, quotes and field labels.
+
+    Spans shortened with an ellipsis must match piece by piece. No evidence counts as not verbatim.
+    """
+    if not evidence:
+        return False
+    haystack = _normalize(source)
+    for span in evidence:
+        pieces = [_normalize(_FIELD_LABEL.sub("", p)).strip(" .,;:") for p in _ELLIPSIS.split(span)]
+        if not all(p in haystack for p in pieces if p) or not any(pieces):
+            return False
+    return True
+
+
+def escalation_reasons(
+    rec: DefRecord,
+    out: ClfOut,
+    source: str,
+    conditions: set[str],
+    min_confidence: float,
+) -> list[str]:
+    """Which enabled conditions call for a second opinion from a larger model."""
+    reasons = []
+    # A model that reports no confidence is treated as unsure
+    if "low_confidence" in conditions and (out.confidence is None or out.confidence < min_confidence):
+        reasons.append("low_confidence")
+    if "evidence_not_verbatim" in conditions and not evidence_is_verbatim(out.evidence, source):
+        reasons.append("evidence_not_verbatim")
+    if "guardrail_disagreement" in conditions and apply_guardrails(rec, out.risk) != out.risk:
+        reasons.append("guardrail_disagreement")
+    if "high_label" in conditions and out.risk == Risk.High:
+        reasons.append("high_label")
+    return reasons
+
+
+def route_classification(
+    classify: Callable[[str], tuple[DefRecord, ClfOut]],
+    source: str,
+    models: list[str] | None = None,
+    conditions: set[str] | None = None,
+    min_confidence: float | None = None,
+) -> RoutedOut:
+    """Call `classify(model)` up the model ladder until an answer needs no escalation.
+
+    The last model's answer is always accepted. A model whose reply cannot be
+    parsed is escalated as "invalid_output"; the last model's errors propagate.
+    """
+    models = models or routing_models()
+    conditions = escalation_conditions() if conditions is None else conditions
+    min_confidence = settings.routing_min_confidence if min_confidence is None else min_confidence
+    steps: list[tuple[str, list[str]]] = []
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        try:
+            rec, out = classify(model)
+        except (StructuredOutputError, OutputParserException):
+            if last:
+                raise
+            steps.append((model, ["invalid_output"]))
+            continue
+        reasons = [] if last else escalation_reasons(rec, out, source, conditions, min_confidence)
+        if not reasons:
+            return RoutedOut(record=rec, out=out, model=model, steps=steps)
+        steps.append((model, reasons))
+    raise AssertionError("unreachable: the last model's answer is always accepted")
+
+
+def classify_routed(
+    entry: DefRecord | str,
+    index: VectorStore | None,
+    k: int = 3,
+    provider: str | None = None,
+    use_rag: bool | None = None,
+    models: list[str] | None = None,
+) -> RoutedOut:
+    """Routed `classify_record` for a record, or `extract_and_classify_block` for a raw block (fused mode)."""
+    if isinstance(entry, DefRecord):
+        def call(model: str) -> tuple[DefRecord, ClfOut]:
+            return entry, classify_record(entry, index, k=k, model_name=model, provider=provider, use_rag=use_rag)
+        source = record_text(entry)
+    else:
+        def call(model: str) -> tuple[DefRecord, ClfOut]:
+            return extract_and_classify_block(entry, index, k=k, model_name=model, provider=provider, use_rag=use_rag)
+        source = entry
+    return route_classification(call, source, models=models)
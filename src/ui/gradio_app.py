@@ -1,16 +1,20 @@
 from __future__ import annotations
 
 from pathlib import Path
+import json
 import os
+import httpx
 import pandas as pd
 import gradio as gr
-import requests
 from dotenv import load_dotenv
 
 load_dotenv()
 
 API_BASE = os.getenv("RSRISK_API_BASE", "http://localhost:8000")
 MODEL_CHOICES = [m for m in os.getenv("UI_MODEL_CHOICES", "gpt-5,gpt-5-mini,gpt-5-nano").split(",") if m]
+CLIENT_TIMEOUT = 180.0
+# Server-side deadline, a little under the client timeout so partial results still arrive
+REQUEST_DEADLINE = float(os.getenv("UI_REQUEST_DEADLINE", str(CLIENT_TIMEOUT - 10)))
 CUSTOM_CSS = """
 /* Wrap table and allow scroll on overflow */
 .wrap-table { max-height: 70vh; overflow: auto; }
@@ -49,50 +53,118 @@ CUSTOM_CSS = """
 }
 """
 
-def classify(
+RESULT_COLUMNS = [
+    "deficiency", "root_cause", "corrective", "preventive",
+    "risk_llm", "risk_final", "rationale", "evidence",
+]
+
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Shared pooled client so concurrent sessions reuse keep-alive connections to the API."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=API_BASE,
+            timeout=httpx.Timeout(CLIENT_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        )
+    return _client
+
+
+def _error_detail(resp: httpx.Response) -> str:
+    try:
+        return resp.json().get("detail") or f"HTTP {resp.status_code}"
+    except Exception:
+        return f"HTTP {resp.status_code}"
+
+
+async def _download_export(result_id: str, pdf_path: str | Path) -> str | None:
+    out_dir = Path("outputs"); out_dir.mkdir(exist_ok=True)
+    out_path = out_dir / (Path(pdf_path).stem + "_predictions.xlsx")
+    async with _get_client().stream("GET", f"/v1/results/{result_id}/export") as resp:
+        if resp.status_code >= 400:
+            return None
+        with open(out_path, "wb") as f:
+            async for chunk in resp.aiter_bytes():
+                f.write(chunk)
+    return str(out_path)
+
+
+async def classify(
     pdf_path: str | Path,
     model_name: str | None = None,
     use_rag: bool = False,
     embed_model: str | None = None,
+    progress=gr.Progress(),
 ):
-    # Call API once and build DataFrame
-    url = f"{API_BASE}/v1/classify"
-    params = {"use_rag": str(use_rag).lower()}
+    # Stream results from the API and render the table row by row
+    params = {"use_rag": str(use_rag).lower(), "stream": "true"}
     if model_name:
         params["model"] = model_name
     if embed_model:
         params["embed_model"] = embed_model
+    if not pdf_path:
+        yield pd.DataFrame(), None, "⚠️ Please upload a PDF file."
+        return
+
+    rows: list[dict] = []
+    total = 0
+    notice = ""
+    result_id = None
+    progress(0, desc="Uploading and extracting deficiencies...")
+    yield pd.DataFrame(columns=RESULT_COLUMNS), None, "⏳ Extracting deficiencies..."
     try:
-        with open(pdf_path, "rb") as f:
-            files = {"pdf": (Path(pdf_path).name, f, "application/pdf")}
-            resp = requests.post(url, files=files, params=params, timeout=180)
-        resp.raise_for_status()
-        data = resp.json(); items = data.get("items", [])
-        df = pd.DataFrame(items)
-        notice = data.get("notice") or ""
-    except requests.HTTPError as e:
+        files = {"pdf": (Path(pdf_path).name, Path(pdf_path).read_bytes(), "application/pdf")}
+        headers = {"X-Request-Timeout": f"{REQUEST_DEADLINE:g}"} if REQUEST_DEADLINE > 0 else None
+        async with _get_client().stream("POST", "/v1/classify", files=files, params=params, headers=headers) as resp:
+            if resp.status_code >= 400:
+                await resp.aread()
+                yield pd.DataFrame(), None, f"⚠️ {_error_detail(resp)}"
+                return
+            async for line in resp.aiter_lines():
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                kind = event.get("event")
+                if kind == "start":
+                    total = int(event.get("total") or 0)
+                    notice = event.get("notice") or ""
+                    if event.get("llm_calls_saved"):
+                        dedup_note = (
+                            f"{total} records grouped into {event.get('dedup_groups')} near-duplicate groups "
+                            f"({event['llm_calls_saved']} LLM calls saved)."
+                        )
+                        notice = f"{notice}\n\n{dedup_note}" if notice else dedup_note
+                    progress((0, total), desc="Classifying", unit="records")
+                    yield pd.DataFrame(columns=RESULT_COLUMNS), None, notice or f"Classifying 0/{total}..."
+                elif kind == "item":
+                    rows.append(event["item"])
+                    progress((len(rows), total), desc="Classifying", unit="records")
+                    status = f"Classifying {len(rows)}/{total}..."
+                    yield pd.DataFrame(rows, columns=RESULT_COLUMNS), None, (f"{notice}\n\n{status}" if notice else status)
+                elif kind == "error":
+                    yield pd.DataFrame(rows, columns=RESULT_COLUMNS), None, f"⚠️ {event.get('detail')}"
+                    return
+                elif kind == "done":
+                    result_id = event.get("result_id")
+                    if event.get("partial"):
+                        cut = f"⚠️ Time limit reached: {event.get('not_classified')} records were not classified."
+                        notice = f"{notice}\n\n{cut}" if notice else cut
+    except httpx.HTTPError as e:
+        yield pd.DataFrame(rows, columns=RESULT_COLUMNS), None, f"⚠️ {e}"
+        return
+
+    # Fetch the Excel export produced by the server (uses final risk labels)
+    df = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    out_path = None
+    if result_id:
         try:
-            err = e.response.json()
-            msg = err.get("detail") or str(e)
-        except Exception:
-            msg = str(e)
-        return pd.DataFrame(), None, f"⚠️ {msg}"
-
-    # Create Excel locally from JSON results (use final risk labels)
-    out_dir = Path("outputs"); out_dir.mkdir(exist_ok=True)
-    out_path = out_dir / (Path(pdf_path).stem + "_predictions.xlsx")
-    try:
-        risks = df["risk_final"] if "risk_final" in df.columns else pd.Series(dtype=str)
-        excel_df = pd.DataFrame({
-            "Deficiency": list(range(1, len(risks) + 1)),
-            "Risk": risks.astype(str).tolist(),
-        })
-        excel_df.to_excel(out_path, index=False)
-    except Exception as e:
-        print("Error creating Excel file: ", e)
-        # Fallback: dump all rows to Excel if structure differs
-        df.to_excel(out_path, index=False)
-    return df, str(out_path), notice
+            out_path = await _download_export(result_id, pdf_path)
+        except httpx.HTTPError as e:
+            print("Error downloading Excel export: ", e)
+    yield df, out_path, notice
 
 
 with gr.Blocks(title="RightShip Risk Classifier", css=CUSTOM_CSS) as demo:
@@ -142,6 +214,8 @@ with gr.Blocks(title="RightShip Risk Classifier", css=CUSTOM_CSS) as demo:
 
 
 def main():
+    # Handlers are async and only await the API, so many sessions can share one worker
+    demo.queue(default_concurrency_limit=int(os.getenv("UI_CONCURRENCY", "16")))
     demo.launch(server_name="0.0.0.0", server_port=7860)
 
 
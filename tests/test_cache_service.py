@@ -0,0 +1,38 @@
+import os
+import time
+
+from src.services.cache_service import DirRetention
+from src.services.result_store import ResultWriter
+
+
+def _age(path, seconds: float) -> None:
+    t = time.time() - seconds
+    os.utime(path, (t, t))
+
+
+def test_size_pruning_spares_results_still_being_written(tmp_path):
+    writer = ResultWriter(tmp_path, {"run": 1})
+    writer.write_item({"x": "a" * 4000})
+    writer._fh.flush()
+    _age(writer._part, 3600)  # long run: last flush is old, but the writer is alive
+    for i in range(3):
+        path = tmp_path / f"{i:032x}.jsonl"
+        path.write_text("b" * 1000)
+        _age(path, 300 - i)
+
+    removed = DirRetention(tmp_path, ttl_seconds=0, max_bytes=1500, interval=60).prune()
+
+    assert removed == 2
+    assert sorted(p.name for p in tmp_path.glob("*.jsonl")) == [f"{2:032x}.jsonl"]
+    assert (tmp_path / f"{writer.commit()}.jsonl").exists()
+
+
+def test_ttl_removes_abandoned_parts(tmp_path):
+    stale = tmp_path / "dead.jsonl.part"
+    stale.write_text("x")
+    _age(stale, 7200)
+    live = tmp_path / "live.jsonl.part"
+    live.write_text("x")
+
+    assert DirRetention(tmp_path, ttl_seconds=3600, max_bytes=0).prune() == 1
+    assert not stale.exists() and live.exists()
@@ -0,0 +1,40 @@
+from src.core.schemas import DefRecord
+from src.services.dedup_service import group_near_duplicates, record_text
+
+BOILERPLATE = {
+	"root_cause": (
+		"Inadequate familiarization of crew with onboard procedures and company safety management system "
+		"requirements, combined with lack of effective supervision by the responsible officer during routine "
+		"inspections and insufficient verification of planned maintenance records by the chief engineer"
+	),
+	"corrective": (
+		"Crew briefed on the requirements of the safety management system, the item was rectified on board, "
+		"tested in the presence of the master and verified as satisfactory before the vessel departed port"
+	),
+	"preventive": (
+		"Topic included in the agenda of the monthly safety committee meeting, lessons learned circulated to "
+		"all fleet vessels and the onboard inspection checklist revised to include this item for future audits"
+	),
+}
+
+
+def _group(recs: list[DefRecord]) -> list[list[int]]:
+	return group_near_duplicates([record_text(r) for r in recs], anchors=[r.deficiency for r in recs])
+
+
+def test_shared_boilerplate_does_not_group_different_findings():
+	recs = [
+		DefRecord(deficiency="Fire extinguisher in engine room found expired", **BOILERPLATE),
+		DefRecord(deficiency="Garbage record book entries not signed", **BOILERPLATE),
+		DefRecord(deficiency="Emergency generator failed to start", **BOILERPLATE),
+	]
+	assert _group(recs) == [[0], [1], [2]]
+
+
+def test_same_finding_on_other_vessels_is_grouped():
+	recs = [
+		DefRecord(deficiency="MV Ocean Star: portable fire extinguisher No. 12 in engine room found expired on 12/03/2024", **BOILERPLATE),
+		DefRecord(deficiency="Gangway safety net not rigged", **BOILERPLATE),
+		DefRecord(deficiency="MV Pacific Dawn: portable fire extinguisher No. 7 in engine room found expired on 02/11/2023", **BOILERPLATE),
+	]
+	assert _group(recs) == [[0, 2], [1]]
@@ -0,0 +1,32 @@
+import httpx
+from langchain_openai import ChatOpenAI
+
+from src.services import extraction_service
+from src.services.extraction_service import extract_records
+
+REPORT = (
+	"Deficiency 1\n"
+	"Deficiency: Fire extinguisher in engine room found expired.\n"
+	"Root Cause: Inspection schedule not followed.\n"
+	"Corrective Action: Replaced.\n"
+	"Preventive Action: Added to PMS.\n\n"
+	"Deficiency 2\n"
+	"During the inspection the gangway safety net was found not rigged.\n"
+)
+
+
+def test_api_error_keeps_raw_block_and_other_records(monkeypatch):
+	def unreachable(request: httpx.Request) -> httpx.Response:
+		raise httpx.ConnectError("connection refused", request=request)
+
+	def get_chat_llm(provider=None, model=None, temperature=0):
+		client = httpx.Client(transport=httpx.MockTransport(unreachable))
+		return ChatOpenAI(model="gpt-test", api_key="sk-test", http_client=client, max_retries=0)
+
+	monkeypatch.setattr(extraction_service, "get_chat_llm", get_chat_llm)
+	recs = extract_records(REPORT)
+
+	assert [r.deficiency for r in recs] == [
+		"Fire extinguisher in engine room found expired.",
+		"During the inspection the gangway safety net was found not rigged.",
+	]
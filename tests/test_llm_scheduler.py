@@ -0,0 +1,185 @@
+import random
+import threading
+import time
+
+import httpx
+import pytest
+
+from src.services.llm_services import Deadline, LLMScheduler, ScheduledTransport, TokenBucket, report_scope
+
+URL = "https://api.test/v1/chat/completions"
+BODY = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 1}
+
+
+def _client(scheduler: LLMScheduler, handler, max_retries: int = 3) -> httpx.Client:
+    transport = ScheduledTransport(scheduler, inner=httpx.MockTransport(handler), max_retries=max_retries)
+    return httpx.Client(transport=transport)
+
+
+def _ok(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={"usage": {"total_tokens": 5}})
+
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(60)  # 1 per second
+    now = time.monotonic()
+    assert all(bucket.reserve(1, now) == 0.0 for _ in range(60))
+    assert abs(bucket.reserve(1, now) - 1.0) < 1e-6
+    assert abs(bucket.reserve(1, now) - 2.0) < 1e-6
+
+
+def test_token_bucket_refills_and_refunds():
+    bucket = TokenBucket(60)
+    now = time.monotonic()
+    bucket.reserve(60, now)
+    assert bucket.reserve(1, now + 2.0) == 0.0
+    bucket.refund(30, now + 2.0)
+    assert bucket.level == 31.0
+    bucket.refund(100, now + 2.0)
+    assert bucket.level == bucket.capacity
+
+
+def test_quota_wait_is_not_counted_as_upstream_latency():
+    scheduler = LLMScheduler(default_rpm=1200, default_tpm=10**9, max_concurrency=16)
+    lane = scheduler._lane("m")
+    initial_limit = lane.limit
+    lane.requests.level = 0.0  # start with an empty request bucket: every call waits for quota
+
+    def handler(request):
+        time.sleep(0.02)
+        return _ok(request)
+
+    client = _client(scheduler, handler)
+
+    def worker():
+        for _ in range(3):
+            assert client.post(URL, json=BODY).status_code == 200
+
+    threads = [threading.Thread(target=worker) for _ in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    snap = scheduler.snapshot()["m"]
+    assert snap["ok"] == 36 and snap["throttled"] == 0
+    assert snap["latency_ewma"] < 0.2
+    assert lane.limit >= initial_limit
+
+
+def test_jittered_latency_and_a_stray_400_do_not_shrink_the_limit():
+    scheduler = LLMScheduler(default_rpm=10**5, default_tpm=10**9, max_concurrency=16)
+    lane = scheduler._lane("m")
+    initial_limit = lane.limit
+    rng = random.Random(0)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(400, json={"error": {"message": "bad request"}})
+        time.sleep(rng.uniform(0.03, 0.07))
+        return _ok(request)
+
+    client = _client(scheduler, handler)
+    assert client.post(URL, json=BODY).status_code == 400
+
+    def worker():
+        for _ in range(5):
+            assert client.post(URL, json=BODY).status_code == 200
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    snap = scheduler.snapshot()["m"]
+    assert snap["rejected"] == 1 and snap["ok"] == 40 and snap["errors"] == 0
+    assert lane.limit >= initial_limit
+
+
+def test_429_is_retried_and_halves_the_limit():
+    scheduler = LLMScheduler(default_rpm=1000, default_tpm=10**9, max_concurrency=16)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"retry-after": "0"}, json={"error": {}})
+        return _ok(request)
+
+    resp = _client(scheduler, handler).post(URL, json=BODY)
+
+    assert resp.status_code == 200 and len(calls) == 2
+    snap = scheduler.snapshot()["m"]
+    assert snap["throttled"] == 1 and snap["ok"] == 1
+    assert snap["limit"] < 8
+
+
+def test_timeout_from_own_deadline_does_not_cut_the_limit():
+    scheduler = LLMScheduler(default_rpm=1000, default_tpm=10**9, max_concurrency=16)
+
+    def handler(request):
+        time.sleep(0.1)
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    with report_scope("r", Deadline(0.05)):
+        with pytest.raises(httpx.ReadTimeout):
+            _client(scheduler, handler).post(URL, json=BODY)
+
+    snap = scheduler.snapshot()["m"]
+    assert snap["errors"] == 0 and snap["cancelled"] == 1 and snap["sent"] == 1
+    assert snap["limit"] == 8 and snap["in_flight"] == 0
+
+
+def test_unexpected_transport_exception_frees_the_slot():
+    scheduler = LLMScheduler(default_rpm=1000, default_tpm=10**9, max_concurrency=16)
+
+    def handler(request):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        _client(scheduler, handler).post(URL, json=BODY)
+
+    snap = scheduler.snapshot()["m"]
+    assert snap["in_flight"] == 0 and snap["errors"] == 1
+
+
+def test_requests_without_model_bypass_the_scheduler():
+    scheduler = LLMScheduler()
+    resp = _client(scheduler, _ok).get("https://api.test/v1/models")
+    assert resp.status_code == 200
+    assert scheduler.snapshot() == {}
+
+
+def test_queued_reports_are_served_round_robin():
+    scheduler = LLMScheduler(default_rpm=1000, default_tpm=10**9, max_concurrency=1)  # one slot: grants are serialized
+    held = scheduler.acquire("m", 1)
+    lane = scheduler._lane("m")
+    order = []
+    lock = threading.Lock()
+
+    def call(report: str):
+        with report_scope(report):
+            lease = scheduler.acquire("m", 1)
+        with lock:
+            order.append(report)
+        lease.done(200)
+
+    def queued() -> int:
+        with scheduler._cond:
+            return sum(len(q) for q in lane.queues.values())
+
+    threads = []
+    for report in ["a", "a", "a", "b"]:
+        t = threading.Thread(target=call, args=(report,))
+        t.start()
+        threads.append(t)
+        while queued() < len(threads):
+            time.sleep(0.005)
+    held.done(200)
+    for t in threads:
+        t.join()
+
+    assert order == ["a", "b", "a", "a"]
@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+from src.api.router import _cancel_when_abandoned, _export_response
+from src.services.llm_services import Deadline
+from starlette.requests import Request
+
+
+def test_export_is_cancelled_when_client_disconnects_before_first_chunk():
+    deadline = Deadline()
+    cancelled_while_classifying = []
+
+    def items():
+        # Stands in for classification: nothing is encoded until records arrive
+        start = time.monotonic()
+        while not deadline.expired and time.monotonic() - start < 5:
+            time.sleep(0.02)
+        cancelled_while_classifying.append(deadline.expired)
+        return
+        yield
+
+    async def run() -> None:
+        gone = asyncio.Event()
+        asyncio.get_running_loop().call_later(0.3, gone.set)
+
+        async def receive() -> dict:
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict) -> None:
+            pass
+
+        # uvicorn's spec version: Starlette only listens for disconnects between chunks
+        scope = {"type": "http", "asgi": {"spec_version": "2.3"}, "method": "POST", "path": "/", "headers": []}
+        response = _export_response(items(), "report.pdf", "csv", live=True)
+        response = _cancel_when_abandoned(response, Request(scope, receive), deadline)
+        await response(scope, receive, send)
+
+    asyncio.run(run())
+
+    assert cancelled_while_classifying == [True]
+    assert deadline.reason == "client disconnected"
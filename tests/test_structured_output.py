@@ -0,0 +1,60 @@
+import json
+
+import httpx
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+
+from src.core.schemas import ClfOut, Risk
+from src.services.llm_services import REPAIR_SYSTEM, StructuredOutputError, invoke_structured
+
+INVALID = '{"risk": "Severe", "rationale": "Rule 1", "evidence": []}'
+VALID = '{"risk": "High", "rationale": "Rule 1", "evidence": ["fire extinguisher expired"]}'
+
+
+def _llm(replies: list[str], bodies: list[dict]) -> ChatOpenAI:
+    def handler(request: httpx.Request) -> httpx.Response:
+        bodies.append(json.loads(request.content))
+        content = replies[min(len(bodies), len(replies)) - 1]
+        return httpx.Response(200, json={
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-test",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    return ChatOpenAI(model="gpt-test", api_key="sk-test", http_client=client, max_retries=0)
+
+
+def test_schema_is_sent_as_response_format():
+    bodies: list[dict] = []
+    out = invoke_structured(_llm([VALID], bodies), ClfOut, [HumanMessage(content="NEW RECORD: ...")])
+
+    assert out.risk == Risk.High
+    assert bodies[0]["response_format"]["type"] == "json_schema"
+    assert bodies[0]["response_format"]["json_schema"]["name"] == "ClfOut"
+
+
+def test_invalid_reply_is_repaired_with_short_prompt():
+    bodies: list[dict] = []
+    out = invoke_structured(_llm([INVALID, VALID], bodies), ClfOut, [HumanMessage(content="NEW RECORD: ...")])
+
+    assert out.risk == Risk.High
+    repair = bodies[1]["messages"]
+    assert [m["role"] for m in repair] == ["system", "user"]
+    assert repair[0]["content"] == REPAIR_SYSTEM
+    assert INVALID in repair[1]["content"] and "NEW RECORD" not in repair[1]["content"]
+
+
+def test_empty_reply_resends_original_messages():
+    bodies: list[dict] = []
+    invoke_structured(_llm(["", VALID], bodies), ClfOut, [HumanMessage(content="NEW RECORD: ...")])
+
+    assert bodies[1]["messages"] == bodies[0]["messages"]
+
+
+def test_gives_up_after_repair_attempts():
+    bodies: list[dict] = []
+    with pytest.raises(StructuredOutputError):
+        invoke_structured(_llm([INVALID], bodies), ClfOut, [HumanMessage(content="x")], repair_attempts=2)
+    assert len(bodies) == 3